@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+# Kept for "python batch_analysis.py ...", the module is
+# mea_preprocessing.batch_analysis.
+import sys
+from mea_preprocessing import batch_analysis
+
+if __name__ == '__main__':
+    raise SystemExit(batch_analysis.main())
+sys.modules[__name__] = batch_analysis
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Import time of the mea_preprocessing modules.
+
+Every module is imported in a fresh interpreter and the best time of the
+import statement over the repeats is reported. The run fails
+if a module pulls in one of its lazily imported dependencies (matplotlib,
+pandas, scipy, circus), or, with --compare, if it got slower than the
+baseline by more than --tolerance.
+
+Usage:
+    python import_time.py --save-baseline main
+    python import_time.py --compare main
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(HERE, 'baselines')
+
+# module: dependencies it must not import
+MODULES = {
+    'mea_preprocessing': ('matplotlib', 'pandas', 'scipy', 'circus'),
+    'mea_preprocessing.mea60_h5': ('matplotlib', 'pandas', 'scipy', 'circus'),
+    'mea_preprocessing.preprocessing': ('matplotlib', 'pandas', 'scipy', 'circus'),
+    'mea_preprocessing.spike_trains': ('matplotlib', 'pandas', 'scipy', 'circus'),
+    'mea_preprocessing.spykingCircus_output': ('matplotlib', 'pandas', 'scipy', 'circus'),
+    'mea_preprocessing.batch_analysis': ('matplotlib', 'pandas', 'scipy', 'circus'),
+}
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, sorted({{name.split('.')[0] for name in sys.modules}})]))
+"""
+
+
+def import_time(module, repeats):
+    # Best import time (s) of module in fresh interpreters and the top level
+    # packages loaded by it.
+    best, loaded = float('inf'), []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', MEASURE.format(module=module)],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(HERE))
+        seconds, loaded = json.loads(output.stdout.strip().splitlines()[-1])
+        best = min(best, seconds)
+    return best, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('modules', nargs='*', help="modules to time (default: all)")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="allowed slowdown factor vs the baseline")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, 'import_' + args.compare + '.json')) as baselinefile:
+            baseline = json.load(baselinefile)['results']
+
+    failed = False
+    results = {}
+    print("%-40s %10s %10s  %s"%('module', 'time (s)', 'vs base', 'problems'))
+    for module in args.modules or list(MODULES):
+        seconds, loaded = import_time(module, args.repeats)
+        results[module] = {'seconds': seconds}
+        problems = [name for name in MODULES.get(module, ()) if name in loaded]
+        ratio = ''
+        if baseline and module in baseline:
+            factor = seconds/baseline[module]['seconds']
+            ratio = '%.2fx'%factor
+            if factor > args.tolerance:
+                problems.append('slower than baseline')
+        failed |= bool(problems)
+        print("%-40s %10.3f %10s  %s"%(module, seconds, ratio, ', '.join(problems)))
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, 'import_' + args.save_baseline + '.json'),
+                  'w') as baselinefile:
+            json.dump({'repeats': args.repeats, 'results': results}, baselinefile, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the MEA preprocessing hot paths on synthetic MCS files.
+
+Every case runs in a fresh process and reports its best wall time over the
+repeats and the peak RSS of the process. Results can be saved as a named
+baseline and later runs compared against it.
+
+Usage:
+    python run_benchmarks.py --duration 60 --save-baseline main
+    python run_benchmarks.py --duration 60 --compare main
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+BASELINE_DIR = os.path.join(HERE, 'baselines')
+
+
+def _open(filename):
+    from mea_preprocessing.mea60_h5 import Mea60_h5
+    return Mea60_h5(filename, 'r')
+
+
+def _sorted(filename, use_cache=False):
+    # circus is imported on first use, import it here so it is not timed
+    import circus.shared.files
+    from mea_preprocessing.spykingCircus_output import MEA_spykingCircus
+    return MEA_spykingCircus(filename, use_cache=use_cache)
+
+
+# name: (setup(filename) -> state, run(state)), only run is timed
+CASES = {
+    'open': (lambda filename: filename,
+             lambda filename: _open(filename).close()),
+    'get_trigger': (_open,
+                    lambda meafile: meafile.get_trigger()),
+    'get_trigger_events': (_open,
+                           lambda meafile: meafile.get_trigger_events()),
+    'get_trials': (_sorted,
+                   lambda sorted_data: sorted_data.get_trials()),
+    'compute_OOindex': (_sorted,
+                        lambda sorted_data: sorted_data.compute_OOindex_all()),
+    'raw_electrode': (_open,
+                      lambda meafile: meafile.get_electrode(0)[:].sum()),
+    'raw_stream': (_open,
+                   lambda meafile: [block.sum() for _, block in meafile.iter_chunks()]),
+    'calibrated': (_open,
+                   lambda meafile: meafile.get_calibrated_view()[...].sum()),
+}
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes, None if unknown.
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak*1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset
+        except (ImportError, AttributeError):
+            return None
+
+
+def run_case(name, filename, repeats):
+    # Run one case in this process, print its result as JSON.
+    setup, run = CASES[name]
+    times = []
+    for _ in range(repeats):
+        state = setup(filename)
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    print(json.dumps({'seconds': min(times), 'peak_rss': peak_rss()}))
+
+
+def run_isolated(name, filename, repeats):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', name,
+                             '--file', filename, '--repeats', str(repeats)],
+                            capture_output=True, text=True)
+    if output.returncode != 0:
+        return {'error': output.stderr.strip().splitlines()[-1]}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def make_data(directory, args):
+    import synthetic
+    filename = os.path.join(directory, 'bench.h5')
+    synthetic.make_recording(filename, n_electrodes=args.electrodes,
+                             duration=args.duration, framerate=args.framerate,
+                             spontaneous=args.spontaneous, condition=args.condition,
+                             chunked=args.chunked, digital_trigger=args.digital_trigger)
+    try:
+        synthetic.make_results(filename, n_templates=args.templates)
+    except ImportError:
+        print("circus not installed, skipping the sorted-data cases")
+    return filename
+
+
+def report(results, baseline=None):
+    print("%-20s %10s %12s %10s"%('case', 'time (s)', 'peak RSS (MB)', 'vs base'))
+    for name, result in results.items():
+        if 'error' in result:
+            print("%-20s %s"%(name, result['error']))
+            continue
+        rss = result['peak_rss']/2**20 if result['peak_rss'] else float('nan')
+        ratio = ''
+        if baseline and 'seconds' in baseline.get(name, {}):
+            ratio = '%.2fx'%(result['seconds']/baseline[name]['seconds'])
+        print("%-20s %10.4f %12.1f %10s"%(name, result['seconds'], rss, ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('cases', nargs='*', help="cases to run (default: all)")
+    parser.add_argument('--electrodes', type=int, default=60)
+    parser.add_argument('--duration', type=float, default=60., help="recording length in s")
+    parser.add_argument('--spontaneous', type=float, default=5.,
+                        help="s before the first trigger edge")
+    parser.add_argument('--condition', type=float, default=1.,
+                        help="s between trigger edges")
+    parser.add_argument('--framerate', type=int, default=50000, help="sampling rate in Hz")
+    parser.add_argument('--templates', type=int, default=200)
+    parser.add_argument('--chunked', action='store_true',
+                        help="store ChannelData chunked instead of contiguous")
+    parser.add_argument('--digital-trigger', action='store_true',
+                        help="write the trigger as digital stream next to an auxiliary one")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--data-dir', help="keep the synthetic files here")
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        run_case(args.case, args.file, args.repeats)
+        return 0
+    if args.spontaneous + 2*args.condition > args.duration:
+        parser.error("--duration must cover --spontaneous plus two --condition periods "
+                     "to have trigger edges for the trial cases")
+
+    names = args.cases or list(CASES)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = args.data_dir or directory
+        os.makedirs(directory, exist_ok=True)
+        filename = make_data(directory, args)
+        results = {name: run_isolated(name, filename, args.repeats) for name in names}
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, args.compare + '.json')) as baselinefile:
+            baseline = json.load(baselinefile)['results']
+    report(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        settings = {key: getattr(args, key) for key in
+                    ('electrodes', 'duration', 'spontaneous', 'condition', 'framerate',
+                     'templates', 'chunked',
+                     'digital_trigger', 'repeats')}
+        with open(os.path.join(BASELINE_DIR, args.save_baseline + '.json'), 'w') as baselinefile:
+            json.dump({'settings': settings, 'numpy': np.__version__, 'results': results},
+                      baselinefile, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
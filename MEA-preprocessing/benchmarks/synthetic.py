@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic MCS recordings and SpyKING CIRCUS results for benchmarking.
+
+make_recording() writes an h5 file with the layout of the MCS files read by
+Mea60_h5: electrode data in AnalogStream/Stream_2, a trigger in
+AnalogStream/Stream_0 (both with InfoChannel tables) and the trigger edges
+in EventStream/Stream_0. With digital_trigger the trigger stream is marked
+as digital input and an auxiliary analog stream is added as Stream_1.
+make_results() writes the .params, probe and .result.hdf5 files
+MEA_spykingCircus expects next to it.
+"""
+
+import os
+
+import h5py
+import numpy as np
+
+FRAMEBASE = 'Data/Recording_0/'
+
+INFO_DTYPE = np.dtype([
+    ('ChannelID', '<i4'), ('RowIndex', '<i4'), ('GroupID', '<i4'),
+    ('ElectrodeGroup', '<i4'), ('Label', 'S32'), ('RawDataType', 'S32'),
+    ('Unit', 'S8'), ('Exponent', '<i4'), ('ADZero', '<i4'), ('Tick', '<i8'),
+    ('ConversionFactor', '<i8'), ('ADCBits', '<i4'),
+    ('HighPassFilterType', 'S32'), ('HighPassFilterCutOffFrequency', 'S32'),
+    ('HighPassFilterOrder', '<i4'), ('LowPassFilterType', 'S32'),
+    ('LowPassFilterCutOffFrequency', 'S32'), ('LowPassFilterOrder', '<i4')])
+
+# Trigger levels of the MCS digital input
+TRIGGER_LOW = -32768
+TRIGGER_HIGH = -32767
+
+
+def info_channel(n_channels, label, tick, conversion_factor, exponent):
+    info = np.zeros(n_channels, dtype=INFO_DTYPE)
+    info['ChannelID'] = np.arange(n_channels)
+    info['RowIndex'] = np.arange(n_channels)
+    info['Label'] = [('%s%d'%(label, i)).encode() for i in range(n_channels)]
+    info['RawDataType'] = b'Int'
+    info['Unit'] = b'V'
+    info['Exponent'] = exponent
+    info['Tick'] = tick
+    info['ConversionFactor'] = conversion_factor
+    info['ADCBits'] = 24
+    info['HighPassFilterType'] = b'Butterworth'
+    info['HighPassFilterCutOffFrequency'] = b'1'
+    info['HighPassFilterOrder'] = 2
+    return info
+
+
+def make_recording(path, n_electrodes=60, duration=60., framerate=50000,
+                   spontaneous=5., condition=1., chunked=False, block_frames=2**18,
+                   digital_trigger=False, seed=0):
+    # Electrode noise (int32) and a trigger alternating every condition s
+    # after a spontaneous period, written block by block.
+    # chunked: store ChannelData chunked (not memory-mappable).
+    # digital_trigger: write the trigger as MCS digital stream (DataSubType
+    # 'Digital') next to an auxiliary analog stream.
+    if spontaneous + 2*condition > duration:
+        raise ValueError("duration %g s is too short for a rising and falling trigger edge "
+                         "after %g s spontaneous activity"%(duration, spontaneous))
+    rng = np.random.default_rng(seed)
+    tick = int(round(1000000/framerate))
+    n_frames = int(duration*framerate)
+    with h5py.File(path, 'w') as h5file:
+        stream = h5file.create_group(FRAMEBASE + 'AnalogStream/Stream_2')
+        stream.attrs['Label'] = 'Electrode Raw Data'
+        data = stream.create_dataset('ChannelData', shape=(n_electrodes, n_frames),
+                                     dtype=np.int32,
+                                     chunks=(n_electrodes, 2**12) if chunked else None)
+        stream['InfoChannel'] = info_channel(n_electrodes, 'E', tick, 59605, -12)
+        for first in range(0, n_frames, block_frames):
+            last = min(first + block_frames, n_frames)
+            data[:, first:last] = rng.normal(0, 30, (n_electrodes, last - first))
+
+        frames = np.arange(n_frames)
+        condition_frames = int(condition*framerate)
+        spontaneous_frames = int(spontaneous*framerate)
+        high = (frames >= spontaneous_frames) & \
+            (((frames - spontaneous_frames)//condition_frames) % 2 == 0)
+        trigger = np.where(high, TRIGGER_HIGH, TRIGGER_LOW).astype(np.int32)
+        stream = h5file.create_group(FRAMEBASE + 'AnalogStream/Stream_0')
+        if digital_trigger:
+            stream.attrs['Label'] = 'Digital Data'
+            stream.attrs['DataSubType'] = 'Digital'
+            stream['ChannelData'] = trigger[np.newaxis]
+            stream['InfoChannel'] = info_channel(1, 'D', tick, 1, 0)
+            auxiliary = h5file.create_group(FRAMEBASE + 'AnalogStream/Stream_1')
+            auxiliary.attrs['Label'] = 'Analog Data'
+            auxiliary.attrs['DataSubType'] = 'Auxiliary'
+            auxiliary['ChannelData'] = rng.normal(0, 100, (4, n_frames)).astype(np.int32)
+            auxiliary['InfoChannel'] = info_channel(4, 'A', tick, 1, 0)
+        else:
+            stream.attrs['Label'] = 'Analog Data'
+            stream['ChannelData'] = np.vstack([trigger] + [np.full_like(trigger, TRIGGER_LOW)]*3)
+            stream['InfoChannel'] = info_channel(4, 'A', tick, 1, 0)
+
+        edges = np.flatnonzero(trigger[:-1] != trigger[1:]) + 1
+        h5file[FRAMEBASE + 'EventStream/Stream_0/EventEntity_0'] = \
+            np.vstack([edges*tick, np.zeros_like(edges)]).astype(np.int64)
+    return path
+
+
+def make_results(path, n_templates=200, rate=10., seed=0):
+    # SpyKING CIRCUS params, probe and results for the recording path, with
+    # Poisson spike trains of rate Hz per template.
+    import circus
+    rng = np.random.default_rng(seed)
+    with h5py.File(path, 'r') as h5file:
+        n_electrodes, n_frames = h5file[FRAMEBASE + 'AnalogStream/Stream_2/ChannelData'].shape
+        tick = h5file[FRAMEBASE + 'AnalogStream/Stream_2/InfoChannel']['Tick'][0]
+    framerate = 1000000/tick
+    base = os.path.splitext(os.path.abspath(path))[0]
+
+    probe = base + '.prb'
+    side = int(np.ceil(np.sqrt(n_electrodes)))
+    geometry = {i: [100*(i % side), 100*(i//side)] for i in range(n_electrodes)}
+    with open(probe, 'w') as probefile:
+        probefile.write("total_nb_channels = %d\nradius = 100\n"%n_electrodes)
+        probefile.write("channel_groups = {1: {'channels': %s, 'graph': [], 'geometry': %s}}\n"
+                        %(list(range(n_electrodes)), geometry))
+
+    template = os.path.join(os.path.dirname(circus.__file__), 'config.params')
+    with open(template) as templatefile:
+        lines = templatefile.readlines()
+    with open(base + '.params', 'w') as paramsfile:
+        for line in lines:
+            if line.startswith('file_format'):
+                line = 'file_format    = hdf5\n'
+            elif line.startswith('mapping'):
+                line = 'mapping        = %s\n'%probe
+            paramsfile.write(line)
+            if line.startswith('[data]'):
+                paramsfile.write('h5_key = %sAnalogStream/Stream_2/ChannelData\n'%FRAMEBASE)
+                paramsfile.write('sampling_rate = %g\n'%framerate)
+
+    name = os.path.basename(base)
+    os.makedirs(os.path.join(os.path.dirname(base), name), exist_ok=True)
+    result_file = os.path.join(os.path.dirname(base), name, name + '.result.hdf5')
+    with h5py.File(result_file, 'w') as resultfile:
+        for i in range(n_templates):
+            n_spikes = rng.poisson(rate*n_frames/framerate)
+            times = np.sort(rng.integers(0, n_frames, n_spikes)).astype(np.uint32)
+            resultfile['spiketimes/temp_%d'%i] = times
+            resultfile['amplitudes/temp_%d'%i] = np.ones((n_spikes, 2), dtype=np.float32)
+    return result_file
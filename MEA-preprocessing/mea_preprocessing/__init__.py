@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Preprocessing and analysis of MCS MEA recordings.
+
+Modules:
+    mcsmain, mea60_h5      reading and writing MCS h5 files
+    overview               min/max pyramid for plotting raw traces
+    preprocessing          streaming band-pass filter and CAR
+    spike_detection        threshold-crossing spike detection
+    spykingCircus_output   analysis of SpyKING CIRCUS results
+    spike_trains, psth     spike train storage and binning
+    quality_index          response quality index
+    batch_analysis         metrics of many recordings in parallel
+    instrumentation        opt-in timing and I/O statistics of the API
+
+Submodules and the classes below are imported on first use, so importing
+the package (or only the reader) does not load matplotlib, pandas, scipy
+or circus.
+"""
+
+import importlib
+
+__version__ = "0.0"
+
+# name: module defining it
+_EXPORTS = {
+    'MCSh5': 'mcsmain',
+    'Mea60_h5': 'mea60_h5',
+    'TriggerEvents': 'mea60_h5',
+    'OverviewPyramid': 'overview',
+    'StreamingFilter': 'preprocessing',
+    'filter_recording': 'preprocessing',
+    'detect_spikes': 'spike_detection',
+    'MEA_spykingCircus': 'spykingCircus_output',
+    'SpikeTrains': 'spike_trains',
+    'BinnedSpikeCounts': 'psth',
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    raise AttributeError("module %r has no attribute %r"%(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
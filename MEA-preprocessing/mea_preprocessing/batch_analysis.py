@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Batch analysis of sorted MEA recordings.
+
+Runs MEA_spykingCircus and the per-unit metrics over many recordings, every
+recording in its own worker process, and writes a single table with one row per
+unit plus a report with the timing and errors of every file.
+
+Usage:
+    python -m mea_preprocessing.batch_analysis "D:/experiment/*.h5" -o metrics.parquet -j 4
+"""
+
+import argparse
+import glob
+import importlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing.connection import wait
+
+
+def analyse_recording(filename, profile=False):
+    # Metrics of all units of one recording. Runs in a worker process and
+    # never raises, errors are returned in the status instead.
+    # profile: add the per-method statistics of the instrumentation to the
+    # status.
+    start = time.perf_counter()
+    status = {'file': filename, 'n_units': 0, 'seconds': 0.0, 'error': ''}
+    metrics = None
+    if profile:
+        from . import instrumentation
+        instrumentation.stats.reset()
+        instrumentation.enable()
+    try:
+        from .spykingCircus_output import MEA_spykingCircus
+        sorted_data = MEA_spykingCircus(filename)
+        try:
+            metrics = sorted_data.compute_OOindex_all().join(
+                sorted_data.compute_QI_all()).reset_index()
+        finally:
+            sorted_data.meafile.close()
+        metrics.insert(0, 'file', filename)
+        status['n_units'] = len(metrics)
+    except Exception:
+        status['error'] = traceback.format_exc()
+    finally:
+        if profile:
+            status['profile'] = instrumentation.disable().to_dict()
+    status['seconds'] = time.perf_counter() - start
+    return metrics, status
+
+
+def expand_inputs(patterns):
+    # Files matching the given paths/glob patterns, in order, without
+    # duplicates and without overview sidecars (also the .overview.h5 ones
+    # written by earlier versions).
+    from .overview import SIDECAR_SUFFIX
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for filename in matches:
+            if filename.endswith(('.overview.h5', SIDECAR_SUFFIX)):
+                continue
+            if filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+
+def _analyse_in_process(connection, filename, profile):
+    # Entry point of the worker process of one file.
+    connection.send(analyse_recording(filename, profile))
+    connection.close()
+
+
+def run_batch(filenames, workers=None, profile=False):
+    # Analyse all files, each in a fresh process and at most workers at a
+    # time. Returns the consolidated per-unit table and the per-file report.
+    # A failing file is reported and does not abort the run, also if its
+    # process dies (e.g. killed for running out of memory), since no other
+    # file shares the process. The table and the report follow the order
+    # of filenames. profile adds a 'profile' column with the per-method
+    # statistics to the report.
+    workers = workers or os.cpu_count() or 1
+    pending = list(enumerate(filenames))
+    # receiving end of the pipe: (process, input index, filename, start time)
+    running = {}
+    # (metrics, status) per input index
+    results = [None]*len(pending)
+    while pending or running:
+        while pending and len(running) < workers:
+            index, filename = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_analyse_in_process,
+                                              args=(sender, filename, profile))
+            process.start()
+            sender.close()
+            running[receiver] = (process, index, filename, time.perf_counter())
+        # Ready when the result arrived or the process died without one
+        for receiver in wait(list(running)):
+            process, index, filename, start = running.pop(receiver)
+            try:
+                metrics, status = receiver.recv()
+            except EOFError:
+                process.join()
+                metrics = None
+                status = {'file': filename, 'n_units': 0,
+                          'seconds': time.perf_counter() - start,
+                          'error': 'worker process exited with code %s'%process.exitcode}
+            receiver.close()
+            process.join()
+            results[index] = (metrics, status)
+            print("%s: %s (%.1f s)"%(status['file'],
+                                     'failed' if status['error'] else
+                                     '%d units'%status['n_units'],
+                                     status['seconds']))
+    tables = [metrics for metrics, _ in results if metrics is not None]
+    report = [status for _, status in results]
+    import pandas as pd
+    metrics = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    columns = ['file', 'n_units', 'seconds', 'error'] + (['profile'] if profile else [])
+    report = pd.DataFrame(report, columns=columns)
+    return metrics, report
+
+
+def parquet_available():
+    # True if pandas can write parquet files (pyarrow or fastparquet).
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            importlib.import_module(engine)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+def write_table(table, path):
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('inputs', nargs='+',
+                        help="result h5 files or glob patterns")
+    parser.add_argument('-o', '--output', default='metrics.csv',
+                        help="per-unit table, .parquet or .csv")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument('--profile', action='store_true',
+                        help="write per-method timings of every file to <output>_profile.json")
+    args = parser.parse_args(argv)
+
+    if os.path.splitext(args.output)[1].lower() == '.parquet' and not parquet_available():
+        # Checked before the run, the results would be lost when writing
+        args.output = os.path.splitext(args.output)[0] + '.csv'
+        print("pyarrow or fastparquet is needed for parquet, writing %s instead"%args.output)
+    filenames = expand_inputs(args.inputs)
+    metrics, report = run_batch(filenames, args.workers, args.profile)
+    write_table(metrics, args.output)
+    stem, extension = os.path.splitext(args.output)
+    if args.profile:
+        profiles = report.pop('profile')
+        with open(stem + '_profile.json', 'w') as profilefile:
+            json.dump({filename: profile for filename, profile in zip(report['file'], profiles)
+                       if isinstance(profile, dict)}, profilefile, indent=2)
+    write_table(report, stem + '_report' + extension)
+
+    n_failed = int((report['error'] != '').sum())
+    print("%d of %d recordings analysed, %d units, %d failed"
+          %(len(report) - n_failed, len(report), len(metrics), n_failed))
+    return 1 if n_failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in timing and I/O instrumentation of the MEA analysis API.
+
+enable() wraps the public methods (and __init__) of MCSh5, Mea60_h5 and
+MEA_spykingCircus and records for every method the number of calls, the
+wall time, the bytes read from h5 datasets and memory-mapped ChannelData
+and, with memory=True, the peak memory allocated during the call
+(tracemalloc, slow). disable() restores the original methods, so nothing
+is measured and nothing costs time unless instrumentation is enabled.
+Times and allocations are inclusive of nested calls, bytes are counted in
+the thread calling the method. Generator methods such as iter_chunks are
+measured while they run, summed over all blocks.
+
+Usage:
+    from mea_preprocessing import instrumentation
+    with instrumentation.profile() as stats:
+        sorted_data = MEA_spykingCircus(filename)
+        sorted_data.compute_OOindex_all()
+    print(stats.table())
+    stats.save_json('profile.json')
+"""
+
+import functools
+import importlib
+import inspect
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import h5py
+import numpy as np
+
+# module: classes whose methods are instrumented
+INSTRUMENTED = {
+    'mcsmain': ('MCSh5',),
+    'mea60_h5': ('Mea60_h5',),
+    'spykingCircus_output': ('MEA_spykingCircus',),
+}
+
+FIELDS = ('calls', 'seconds', 'max_seconds', 'bytes_read', 'peak_bytes')
+
+
+class CallStats():
+    # Per-method totals, keyed by 'Class.method'.
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, bytes_read, peak_bytes):
+        with self._lock:
+            record = self.records.setdefault(name, dict.fromkeys(FIELDS, 0))
+            record['calls'] += 1
+            record['seconds'] += seconds
+            record['max_seconds'] = max(record['max_seconds'], seconds)
+            record['bytes_read'] += bytes_read
+            record['peak_bytes'] = max(record['peak_bytes'], peak_bytes)
+
+    def reset(self):
+        with self._lock:
+            self.records = {}
+
+    def to_dict(self):
+        with self._lock:
+            return {name: dict(record) for name, record in self.records.items()}
+
+    def table(self):
+        # DataFrame with one row per method, the slowest first.
+        import pandas as pd
+        table = pd.DataFrame.from_dict(self.to_dict(), orient='index',
+                                       columns=list(FIELDS))
+        table['mean_seconds'] = table['seconds']/table['calls']
+        table.index.name = 'method'
+        return table.sort_values('seconds', ascending=False)
+
+    def save_json(self, path):
+        with open(path, 'w') as jsonfile:
+            json.dump(self.to_dict(), jsonfile, indent=2)
+
+
+stats = CallStats()
+_state = threading.local()
+# (owner, attribute name, original) of everything patched by enable()
+_patched = []
+_memory = False
+_started_tracing = False
+
+
+def _stack():
+    if not hasattr(_state, 'stack'):
+        _state.stack = []
+    return _state.stack
+
+
+def _count_bytes(data):
+    # Add the size of data read to all calls running in this thread.
+    stack = _stack()
+    if stack and isinstance(data, np.ndarray):
+        for frame in stack:
+            frame['bytes_read'] += data.nbytes
+    return data
+
+
+def _enter():
+    frame = {'start': time.perf_counter(), 'bytes_read': 0}
+    if _memory:
+        # Fold the peak so far into the running calls before resetting it
+        current, peak = tracemalloc.get_traced_memory()
+        for outer in _stack():
+            outer['peak'] = max(outer['peak'], peak)
+        tracemalloc.reset_peak()
+        frame['base'] = frame['peak'] = current
+    _stack().append(frame)
+    return frame
+
+
+def _exit(name, frame):
+    stack = _stack()
+    stack.remove(frame)
+    peak_bytes = 0
+    if _memory:
+        frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        peak_bytes = frame['peak'] - frame['base']
+        for outer in stack:
+            outer['peak'] = max(outer['peak'], frame['peak'])
+    stats.add(name, time.perf_counter() - frame['start'], frame['bytes_read'], peak_bytes)
+
+
+def _timed(name, method):
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator(*args, **kwargs):
+            iterator = method(*args, **kwargs)
+            total = dict.fromkeys(('seconds', 'bytes_read', 'peak'), 0)
+            try:
+                while True:
+                    frame = _enter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        _exit_generator(frame, total)
+                    yield item
+            finally:
+                iterator.close()
+                stats.add(name, total['seconds'], total['bytes_read'], total['peak'])
+        return generator
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        frame = _enter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _exit(name, frame)
+    return wrapper
+
+
+def _exit_generator(frame, total):
+    # Like _exit, but summed into total until the generator is done.
+    stack = _stack()
+    stack.remove(frame)
+    total['seconds'] += time.perf_counter() - frame['start']
+    total['bytes_read'] += frame['bytes_read']
+    if _memory:
+        frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        total['peak'] = max(total['peak'], frame['peak'] - frame['base'])
+        for outer in stack:
+            outer['peak'] = max(outer['peak'], frame['peak'])
+
+
+def _patch(owner, attribute, replacement):
+    _patched.append((owner, attribute, owner.__dict__[attribute]))
+    setattr(owner, attribute, replacement)
+
+
+def enable(memory=False):
+    # Start recording into stats. memory: also trace the peak allocation of
+    # every call with tracemalloc (several times slower).
+    global _memory, _started_tracing
+    if _patched:
+        return stats
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    for module, classes in INSTRUMENTED.items():
+        module = importlib.import_module('.' + module, __package__)
+        for cls in classes:
+            cls = getattr(module, cls)
+            for attribute, method in list(cls.__dict__.items()):
+                if inspect.isfunction(method) and \
+                        (attribute == '__init__' or not attribute.startswith('_')):
+                    _patch(cls, attribute, _timed(cls.__name__ + '.' + attribute, method))
+
+    def read(getitem):
+        @functools.wraps(getitem)
+        def wrapper(self, *args, **kwargs):
+            return _count_bytes(getitem(self, *args, **kwargs))
+        return wrapper
+    _patch(h5py.Dataset, '__getitem__', read(h5py.Dataset.__getitem__))
+    _patch(np.memmap, '__getitem__', read(np.memmap.__getitem__))
+    return stats
+
+
+def disable():
+    # Restore the original methods, the recorded stats are kept.
+    global _memory, _started_tracing
+    while _patched:
+        owner, attribute, original = _patched.pop()
+        setattr(owner, attribute, original)
+    if _started_tracing:
+        tracemalloc.stop()
+    _memory = _started_tracing = False
+    return stats
+
+
+def is_enabled():
+    return bool(_patched)
+
+
+@contextmanager
+def profile(memory=False, reset=True):
+    # Instrument the calls within the with block, yields stats.
+    if reset:
+        stats.reset()
+    enable(memory)
+    try:
+        yield stats
+    finally:
+        disable()
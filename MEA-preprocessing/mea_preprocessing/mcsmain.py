@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Class handling different types of mcs-h5 files.
+Created on Fri Oct 13 08:52:14 2017
+
+@author: FlorianJ
+"""
+__version__ = "0.0"
+#OPEN ISSUE:
+#AUTOMATIC RECOGNITION OF h5-DATATYPE OF EXISTING FILES 
+#(streams of MCS files are recognized by MCSh5.index_streams)
+import numpy as np
+import h5py
+import re
+from os.path import exists
+
+#Stream types of MCS AnalogStreams and the DataSubType/Label keywords
+#identifying them, in order of precedence.
+STREAM_TYPES = (('digital', ('Digital',)),
+                ('analog', ('Auxiliary', 'Analog')),
+                ('electrode', ('Electrode', 'Filtered')))
+#Streams without DataSubType or Label with at least this many channels in V
+#are taken as electrode streams.
+MIN_ELECTRODE_CHANNELS = 16
+
+#Number of frames converted per block by CalibratedView.
+CALIB_CHUNK_FRAMES = 2**16
+
+class CalibratedView(object):
+  #Lazily calibrated view on a dataset whose last axis is time.
+  #Slicing reads only the selected hyperslab and converts it block by block
+  #into a single output array of the requested dtype, so there are no
+  #full-size temporaries. Calibration is (raw - offset) * scale per channel.
+  def __init__(self, dataset, scale, offset = None, dtype = np.float32):
+    self.dataset = dataset
+    self.dtype = np.dtype(dtype)
+    #scale and offset have the shape of the dataset without the time axis.
+    self.scale = np.asarray(scale, dtype = self.dtype)
+    self.offset = None if offset is None else np.asarray(offset, dtype = self.dtype)
+    return
+
+  @property
+  def shape(self):
+    return self.dataset.shape
+
+  @property
+  def ndim(self):
+    return len(self.dataset.shape)
+
+  def __len__(self):
+    return self.dataset.shape[0]
+
+  def __array__(self, dtype = None, copy = None):
+    data = self[...]
+    return data if dtype is None else data.astype(dtype, copy = False)
+
+  def __getitem__(self, key):
+    key = self._expand_key(key)
+    channel_key, time_key = key[:-1], key[-1]
+    scale = self.scale[channel_key]
+    offset = None if self.offset is None else self.offset[channel_key]
+    if not isinstance(time_key, (int, np.integer)):
+      scale = scale[..., np.newaxis]
+      offset = None if offset is None else offset[..., np.newaxis]
+    if not isinstance(time_key, slice) or time_key.indices(self.shape[-1])[2] != 1:
+      return self._calibrate(self._read(key), scale, offset)
+    start, stop, _ = time_key.indices(self.shape[-1])
+    out = None
+    for first in range(start, stop, CALIB_CHUNK_FRAMES):
+      last = min(first + CALIB_CHUNK_FRAMES, stop)
+      raw = self._read(channel_key + (slice(first, last),))
+      if out is None:
+        out = np.empty(raw.shape[:-1] + (stop - start,), dtype = self.dtype)
+      view = out[..., first - start:last - start]
+      view[...] = raw
+      self._calibrate(view, scale, offset)
+    if out is None:
+      out = self._calibrate(self._read(key), scale, offset)
+    return out
+
+  def _read(self, key):
+    #Read the expanded key from the dataset. h5py only accepts increasing,
+    #unique index lists, so an index list is read sorted and deduplicated
+    #and reordered afterwards.
+    for axis, k in enumerate(key):
+      if isinstance(k, (list, np.ndarray)):
+        k = np.asarray(k)
+        k = np.flatnonzero(k) if k.dtype == bool else k % self.shape[axis]
+        rows, order = np.unique(k, return_inverse = True)
+        raw = self.dataset[key[:axis] + (list(rows),) + key[axis + 1:]]
+        if np.array_equal(rows, k):
+          return raw
+        #Axis of the list in the result, integer indices drop their axis
+        position = sum(not isinstance(j, (int, np.integer)) for j in key[:axis])
+        return np.take(raw, order.ravel(), axis = position)
+    return self.dataset[key]
+
+  def _calibrate(self, data, scale, offset):
+    #Convert in place when possible.
+    if data.dtype != self.dtype:
+      data = data.astype(self.dtype)
+    if offset is not None:
+      data -= offset
+    data *= scale
+    return data
+
+  def _expand_key(self, key):
+    #Expand the key to one entry per dataset axis.
+    if not isinstance(key, tuple):
+      key = (key,)
+    if any(k is Ellipsis for k in key):
+      i = [k is Ellipsis for k in key].index(True)
+      fill = (slice(None),) * (self.ndim - len(key) + 1)
+      key = key[:i] + fill + key[i + 1:]
+    return key + (slice(None),) * (self.ndim - len(key))
+
+def _decode(value):
+  return value.decode() if isinstance(value, bytes) else str(value)
+
+def _stream_number(name):
+  #Sort key for names like Stream_10 or Recording_1.
+  match = re.search(r'(\d+)$', name)
+  return int(match.group(1)) if match else -1
+
+class MCSh5(h5py.File):
+  #Inherit h5 class functions and attributes.
+  def __init__(self, filepath,*args, **argv):
+    self.filepath = filepath
+    # Create some useful proxy's to attributes of the HDF5 File
+    if not exists(self.filepath):
+      h5py.File.__init__(self, filepath, *args, **argv)
+      self.set_default(argv)
+    else:
+      h5py.File.__init__(self, filepath, *args, **argv)
+    return 
+  def update(self):
+    print('Included in subclasses.')
+    return
+  def close(self):
+    #Release the memory map before closing the file.
+    self.mmap = None
+    h5py.File.close(self)
+    return
+
+  def memmap_dataset(self, dataset):
+    #Map a contiguous, uncompressed dataset of a read only file directly as
+    #numpy.memmap using its file offset, bypassing the h5py copy path.
+    #Returns None for chunked/compressed datasets, which need h5py.
+    if self.mode != 'r' or self.driver not in ('sec2', 'stdio'):
+      return None
+    if dataset.chunks is not None or dataset.dtype.kind not in 'iuf':
+      return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+      #Storage not allocated yet.
+      return None
+    return np.memmap(self.filename, mode = 'r', dtype = dataset.dtype,
+                     shape = dataset.shape, offset = offset)
+
+  def get_source(self):
+    #Memory map of the data if available, else the h5py dataset.
+    if getattr(self, 'mmap', None) is not None:
+      return self.mmap
+    return self.data
+
+  def update_guid(self):
+    print('Not available for non CMOS-MEA files.')
+    return
+  
+  def index_streams(self):
+    #Index of the MCS streams, built in one pass over the Recording_*
+    #groups reading only group attributes and InfoChannel tables:
+    #{recording: {'electrode': [...], 'analog': [...], 'digital': [...],
+    #'event': [...]}}. Analog stream entries are dicts with path, label,
+    #n_channels, tick and unit, electrode streams with 'Raw' in their label
+    #first. Event entries are EventEntity dataset paths.
+    #The index is cached in self.streams.
+    streams = {}
+    data = self.get('Data')
+    if data is None:
+      self.streams = streams
+      return streams
+    for recording_name in sorted(data, key = _stream_number):
+      if not recording_name.startswith('Recording_'):
+        continue
+      recording = data[recording_name]
+      index = {'electrode': [], 'analog': [], 'digital': [], 'event': []}
+      for name in sorted(recording.get('AnalogStream', {}), key = _stream_number):
+        stream = recording['AnalogStream'][name]
+        if 'InfoChannel' not in stream or 'ChannelData' not in stream:
+          continue
+        info = stream['InfoChannel'][:]
+        entry = {'path': stream.name.lstrip('/'),
+                 'label': _decode(stream.attrs.get('Label', b'')),
+                 'n_channels': len(info),
+                 'tick': int(info['Tick'][0]) if len(info) else None,
+                 'unit': _decode(info['Unit'][0]) if len(info) else ''}
+        index[self._classify_stream(stream, entry)].append(entry)
+      index['electrode'].sort(key = lambda entry: 'Raw' not in entry['label'])
+      for name in sorted(recording.get('EventStream', {}), key = _stream_number):
+        stream = recording['EventStream'][name]
+        index['event'].extend(stream[entity].name.lstrip('/')
+                              for entity in sorted(stream, key = _stream_number)
+                              if entity.startswith('EventEntity_'))
+      streams[_stream_number(recording_name)] = index
+    self.streams = streams
+    return streams
+
+  def _classify_stream(self, stream, entry):
+    #Stream type from the DataSubType attribute, the label, or the number
+    #of channels and their unit.
+    for text in (_decode(stream.attrs.get('DataSubType', b'')), entry['label']):
+      for stream_type, keywords in STREAM_TYPES:
+        if any(keyword in text for keyword in keywords):
+          return stream_type
+    if entry['unit'] == 'V' and entry['n_channels'] >= MIN_ELECTRODE_CHANNELS:
+      return 'electrode'
+    return 'analog'
+
+  def get_data(self):
+    return self.data[:,:,:]
+  
+  def get_calib(self):
+    return self.calib
+  
+  def get_scale(self):
+    #Per-channel factor to V, shape of the data without the time axis.
+    #Subclasses cache it in update().
+    if getattr(self, 'scale', None) is None:
+      self.scale = self.get_calib() * 1.e-9
+    return self.scale
+
+  def get_calibrated_view(self, dtype = np.float32):
+    #Lazily calibrated data in V, sliceable like a numpy array.
+    return CalibratedView(self.get_source(), self.get_scale(),
+                          getattr(self, 'adzero', None), dtype)
+
+  def get_calibrated_data(self, dtype = np.float64):
+    #Returns data in V.
+    #IMPORTANT: DIFFERENT FROM self.data[:,:,:] * self.calib[:,:,np.newaxis]!
+    #CLASSIC h5-FILES MIGHT NEED TO TRANSPOSE CALIB!
+    #ALREADY IMPLEMENTED IN classic_h5 read_calib.
+    return self.get_calibrated_view(dtype)[...]
+  
+  def set_default(self, argv = None):
+    #Hook for subclasses to set up new files, nothing to do here.
+    return
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov 27 16:19:23 2024
+
+@author: julio
+"""
+
+from .mcsmain import MCSh5
+from .overview import OverviewPyramid, OVERVIEW_BASE
+from datetime import datetime
+import numpy as np
+import siunits as u
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+FRAMEBASE = 'Data/Recording_0/'
+MCS_H5_DATASET_PATH = FRAMEBASE + 'AnalogStream/Stream_2/ChannelData'  
+MCS_H5_INFO_PATH = FRAMEBASE + 'AnalogStream/Stream_2/InfoChannel'
+#analog input data
+Analog_Channel_Data = FRAMEBASE + 'AnalogStream/Stream_0/ChannelData'
+Analog_Channel_Info = FRAMEBASE + 'AnalogStream/Stream_0/InfoChannel'
+
+#Special datatype for info dataset
+Acquisition_Info_Events_Base = FRAMEBASE + 'EventStream/Stream_0/'
+Acquisition_Info_EventInfo=Acquisition_Info_Events_Base+"/InfoEvent"
+Acquisition_Info_EventEntity=Acquisition_Info_Events_Base+"/EventEntity_0"
+
+#Default number of frames read per hyperslab when streaming ChannelData.
+CHUNK_FRAMES = 2**16
+#Frames per h5 chunk of ChannelData written by create_data, about 1 MB
+#for 60 int32 electrodes to fit the default h5 chunk cache.
+WRITE_CHUNK_FRAMES = 2**12
+
+class TriggerEvents(object):
+  #Level changes of a piecewise constant trigger signal.
+  #edges: frame indices of all level changes, levels: initial level followed
+  #by the level after every change, tick: frame duration in us,
+  #n_frames: number of trigger frames.
+  def __init__(self, edges, levels, tick, n_frames):
+    self.edges = np.asarray(edges, dtype = np.int64)
+    self.levels = np.asarray(levels)
+    self.tick = tick
+    self.n_frames = n_frames
+    return
+
+  @classmethod
+  def from_signal(cls, y, tick):
+    edges = np.flatnonzero(y[:-1] != y[1:]) + 1
+    return cls(edges, np.insert(y[edges], 0, y[0]), tick, len(y))
+
+  @classmethod
+  def from_times(cls, times, tick, n_frames, starts_low = True):
+    #Level changes given as times in s, levels alternate between 0 and 1.
+    edges = np.round(np.asarray(times)*1000000/tick).astype(np.int64)
+    levels = (np.arange(len(edges) + 1) + (not starts_low)) % 2
+    return cls(edges, levels, tick, n_frames)
+
+  @property
+  def times(self):
+    #Times of all level changes in s.
+    return self.edges*self.tick/1000000
+
+  @property
+  def duration(self):
+    return self.n_frames*self.tick/1000000
+
+  @property
+  def starts_low(self):
+    return self.levels[0] == self.levels.min()
+
+  @property
+  def rising(self):
+    #Frame indices of changes from the lowest to the highest level.
+    low, high = self.levels.min(), self.levels.max()
+    return self.edges[(self.levels[:-1] == low) & (self.levels[1:] == high)]
+
+  @property
+  def falling(self):
+    low, high = self.levels.min(), self.levels.max()
+    return self.edges[(self.levels[:-1] == high) & (self.levels[1:] == low)]
+
+  def durations(self):
+    #Durations in s of the constant segments between level changes.
+    return np.diff(np.concatenate(([0], self.times, [self.duration])))
+
+  def step(self):
+    #(times, levels) for plt.step(..., where = 'post').
+    return (np.concatenate(([0], self.times, [self.duration])),
+            np.append(self.levels, self.levels[-1]))
+
+#Mea60_h5 opened by each worker process of map_electrodes.
+_worker_file = None
+
+def _open_worker_file(filepath, recording):
+  global _worker_file
+  _worker_file = Mea60_h5(filepath, 'r', recording = recording)
+  return
+
+def _map_worker_task(task):
+  #Results of func for every electrode of one block.
+  func, electrodes, first, last = task
+  chunks = _worker_file.iter_chunks(electrodes, first, last, last - first)
+  return [func(row) for _, block in chunks for row in block]
+
+class Mea60_h5(MCSh5):
+  def __init__(self, filepath, *args, analog_cache_size = None, recording = 0,
+               **argv):
+    #analog_cache_size: number of analog channel signals kept in memory,
+    #None for no bound.
+    #recording: index of the Data/Recording_* group to read.
+    super(Mea60_h5, self).__init__(filepath, *args, **argv)  
+    self.analog_cache_size = analog_cache_size
+    #Number of frames of a ChannelData being streamed with append_data.
+    self._frames_written = None
+    #Min/max pyramid for plotting, opened by get_overview().
+    self._overview = None
+    self.select_streams(recording)
+    #Update attributes. New files get them once ChannelData is written.
+    if self.data_path in self:
+      self.update()
+    if self.analog_path in self:
+      self.update_analog()
+
+  def select_streams(self, recording = 0):
+    #Set the dataset paths of the electrode, trigger and event streams of a
+    #recording from the stream index. The trigger (analog_path) is the first
+    #digital stream, or the first analog one if there is none. Streams not
+    #found keep the default layout (electrodes in Stream_2, trigger in
+    #Stream_0), e.g. in new files.
+    self.recording = recording
+    if getattr(self, 'streams', None) is None:
+      self.index_streams()
+    index = self.streams.get(recording, {})
+    base = 'Data/Recording_%d/'%recording
+    electrode = index.get('electrode') or [{'path': base + 'AnalogStream/Stream_2'}]
+    analog = index.get('digital') or index.get('analog') or \
+             [{'path': base + 'AnalogStream/Stream_0'}]
+    self.data_path = electrode[0]['path'] + '/ChannelData'
+    self.info_path = electrode[0]['path'] + '/InfoChannel'
+    self.analog_path = analog[0]['path'] + '/ChannelData'
+    self.analog_info_path = analog[0]['path'] + '/InfoChannel'
+    events = index.get('event') or [base + 'EventStream/Stream_0/EventEntity_0']
+    self.event_path = events[0]
+    return
+  
+  #Read methods inherited from MCSh5
+  def update(self):
+    self.data = self[self.data_path]
+    #Zero-copy access for contiguous datasets, None for chunked ones.
+    self.mmap = self.memmap_dataset(self.data)
+    self.info = self[self.info_path]
+    #Update calibration factors.
+    #Datatype is 64 bit integer to be consistent with former dataformat.
+    self.calib = np.array(self.info['ConversionFactor'][:-1],
+                          dtype = np.int64)
+    #Per-channel scale to V and zero level, cached for calibrated views.
+    #Calibrated value = (raw - ADZero) * ConversionFactor * 10**Exponent.
+    self.scale = self.info['ConversionFactor'] * 10.0**self.info['Exponent']
+    self.adzero = self.info['ADZero']
+    #Update framerate.
+    self.framerate = 1000.0/self.info["Tick"][0] # Tick in us to framerate in kHz
+    #electrodes, timestamps
+    self.datashape = ((self.data.shape[0],
+                       self.data.shape[1]))
+    self.duration = self.data.shape[1] * self.info['Tick'][0]
+    self.units = {"time":u.s*10**-6, "voltage": u.v*10**-6, "framerate":u.hz*10**3}
+    return
+  
+  def update_analog(self):
+    #Only the channel metadata is read here, signals are loaded on first
+    #access through get_analog().
+    import pandas as pd
+    self.channels=pd.DataFrame()
+    self.analog=self[self.analog_path]
+    self._analog_cache=OrderedDict()
+    self._trigger_events=None
+    self._trigger_events_source=None
+    channellabels=self[self.analog_info_path]  
+    self.channels["label"]=[el.decode() for el in channellabels["Label"]]
+    self.channels["unit"]=[el.decode() for el in channellabels["Unit"]]
+    self.channels["tick"]=channellabels["Tick"]
+    self.channels["conversionFactor"]=channellabels["ConversionFactor"]
+    self.channels["adcBits"]=channellabels["ADCBits"]
+    self.channels["highPassFilterType"]=[el.decode() for el in channellabels["HighPassFilterType"]]
+    self.channels["highPassFilterCutOffFrequency"]=channellabels["HighPassFilterCutOffFrequency"]
+    self.channels["highPassFilterOrder"]=channellabels["HighPassFilterOrder"]               
+    self.channels["lowPassFilterType"]=[el.decode() for el in channellabels["LowPassFilterType"]]
+    self.channels["lowPassFilterCutOffFrequency"]=channellabels["LowPassFilterCutOffFrequency"]
+    self.channels["lowPassFilterOrder"]=channellabels["LowPassFilterOrder"]   
+    return  
+
+  def get_analog(self, ch):
+    #Signal of analog channel ch, read on first access and kept in a
+    #least recently used cache bounded by analog_cache_size.
+    if ch in self._analog_cache:
+      self._analog_cache.move_to_end(ch)
+      return self._analog_cache[ch]
+    signal = self.analog[ch]
+    self._analog_cache[ch] = signal
+    if self.analog_cache_size is not None:
+      while len(self._analog_cache) > self.analog_cache_size:
+        self._analog_cache.popitem(last = False)
+    return signal
+  
+  def get_data(self):
+    #All of ChannelData as in-memory array, use get_memmap() for a
+    #zero-copy view.
+    return self._read((slice(None), slice(None)))
+
+  def get_memmap(self):
+    #numpy.memmap of ChannelData, None if the dataset is chunked/compressed
+    #or the file is writable. Worker processes should open the file
+    #themselves; the pages are then shared through the page cache.
+    return self.mmap
+
+  def get_electrode(self, idx, time_slice = slice(None)):
+    #Read a single electrode, optionally restricted to a slice of frames.
+    #Only the requested hyperslab is read from ChannelData.
+    start, stop, _ = time_slice.indices(self.datashape[1])
+    return self._read((idx, slice(start, stop)))
+
+  def _read(self, selection):
+    #Writable copy of a selection of ChannelData. Views of the memory map
+    #are read-only, so they are copied like the h5py reads.
+    block = self.get_source()[selection]
+    if isinstance(block, np.memmap):
+      block = np.array(block)
+    return block
+
+  def iter_chunks(self, electrodes = None, t_start = 0, t_stop = None,
+                  chunk_frames = CHUNK_FRAMES):
+    #Stream ChannelData as (first frame, electrodes x frames block) tuples.
+    #electrodes: None for all electrodes, an index or a list of indices.
+    #t_start, t_stop: frame range [t_start, t_stop), t_stop None for the end.
+    start, stop, _ = slice(t_start, t_stop).indices(self.datashape[1])
+    rows, order = self._electrode_selection(electrodes)
+    source = self.get_source()
+    for first in range(start, stop, chunk_frames):
+      last = min(first + chunk_frames, stop)
+      block = source[rows, first:last]
+      if order is not None:
+        block = block[order]
+      yield first, block
+
+  def map_electrodes(self, func, chunk_frames = CHUNK_FRAMES, workers = None,
+                     electrodes = None, processes = False):
+    #Apply func to every electrode x time block in parallel and return the
+    #results stacked as electrodes x blocks (x result shape).
+    #func gets the frames of one electrode in one block (1-D array).
+    #With threads, one reader thread reads each block of all electrodes as
+    #a single hyperslab ahead of the workers, so only the h5py reads are
+    #serialized; numpy releases the GIL in func.
+    #processes = True runs func in worker processes, each opening the file
+    #itself and handling whole blocks; func must then be picklable.
+    if electrodes is None:
+      electrodes = list(range(self.datashape[0]))
+    electrodes = list(np.atleast_1d(electrodes))
+    n_blocks = len(range(0, self.datashape[1], chunk_frames))
+    if n_blocks == 0 or not electrodes:
+      #Nothing to apply func to, the result shape of func is unknown
+      return np.zeros((len(electrodes), n_blocks))
+    if processes:
+      tasks = [(func, electrodes, first, min(first + chunk_frames, self.datashape[1]))
+               for first in range(0, self.datashape[1], chunk_frames)]
+      with ProcessPoolExecutor(max_workers = workers,
+                               initializer = _open_worker_file,
+                               initargs = (self.filepath, self.recording)) as executor:
+        columns = list(executor.map(_map_worker_task, tasks))
+      results = [columns[block][i] for i in range(len(electrodes))
+                 for block in range(n_blocks)]
+    else:
+      chunks = self.iter_chunks(electrodes, chunk_frames = chunk_frames)
+      futures = []
+      with ThreadPoolExecutor(max_workers = 1) as reader, \
+           ThreadPoolExecutor(max_workers = workers) as executor:
+        pending = reader.submit(next, chunks, None)
+        for block in range(n_blocks):
+          _, data = pending.result()
+          pending = reader.submit(next, chunks, None)
+          futures.append([executor.submit(func, row) for row in data])
+          #Bound the blocks held in memory when func is slower than the reads.
+          if block >= 2:
+            wait(futures[block - 2])
+        results = [futures[block][i].result() for i in range(len(electrodes))
+                   for block in range(n_blocks)]
+    results = np.stack([np.asarray(result) for result in results])
+    return results.reshape((len(electrodes), n_blocks) + results.shape[1:])
+
+  def _electrode_selection(self, electrodes):
+    #h5py only accepts increasing, unique index lists for fancy selection.
+    #Returns the row selection to read and the reordering to apply afterwards.
+    if electrodes is None:
+      return slice(None), None
+    electrodes = np.atleast_1d(electrodes)
+    rows, order = np.unique(electrodes, return_inverse = True)
+    if np.array_equal(rows, electrodes):
+      order = None
+    return list(rows), order
+  
+  
+  def set_data(self, data, append = False):
+    #Set whole dataset to data or append data to already existing dataset.
+    #Input data in electrodes x frames.
+    #ChannelData is created if it does not exist yet.
+    view = data
+    if self.data_path not in self:
+      self.create_data(view.shape[0], view.dtype)
+      append = True
+    if append:
+      for first in range(0, view.shape[1], CHUNK_FRAMES):
+        self.append_data(view[:, first:first + CHUNK_FRAMES])
+    else:
+      if view.shape != self[self.data_path].shape:
+        self[self.data_path].resize(view.shape)
+      self[self.data_path][:,:] = view[:,:]
+    self.finish_data()
+    return
+
+  def create_data(self, n_electrodes, dtype = np.int32, info = None,
+                  chunk_frames = WRITE_CHUNK_FRAMES, compression = None):
+    #Create an empty ChannelData (electrodes x 0 frames) with
+    #maxshape (n_electrodes, None) for streaming with append_data.
+    #info: InfoChannel records, written if the file has none yet.
+    #compression: h5py filter, e.g. 'gzip' or 'lzf'.
+    if self.data_path in self:
+      del self[self.data_path]
+    self.create_dataset(self.data_path, shape = (n_electrodes, 0),
+                        maxshape = (n_electrodes, None), dtype = dtype,
+                        chunks = (n_electrodes, chunk_frames),
+                        compression = compression)
+    if info is not None and self.info_path not in self:
+      self[self.info_path] = info
+    self._frames_written = 0
+    return
+
+  def append_data(self, block):
+    #Append an electrodes x frames block to ChannelData. The allocation
+    #grows geometrically, finish_data() trims it to the frames written.
+    dataset = self[self.data_path]
+    if self._frames_written is None:
+      self._frames_written = dataset.shape[1]
+    first = self._frames_written
+    last = first + block.shape[1]
+    if last > dataset.shape[1]:
+      dataset.resize((dataset.shape[0], max(last, 2*dataset.shape[1])))
+    dataset[:, first:last] = block
+    self._frames_written = last
+    return
+
+  def write_blocks(self, blocks):
+    #Append electrodes x frames blocks from an iterable (e.g. a generator)
+    #without holding the whole recording in memory.
+    for block in blocks:
+      self.append_data(block)
+    self.finish_data()
+    return
+
+  def finish_data(self):
+    #Trim ChannelData to the frames written and update attributes.
+    if self._frames_written is not None:
+      dataset = self[self.data_path]
+      if dataset.shape[1] != self._frames_written:
+        dataset.resize((dataset.shape[0], self._frames_written))
+      self._frames_written = None
+    if self.info_path in self:
+      self.update()
+    return
+
+  def close(self):
+    #Finish a streamed ChannelData before closing.
+    if self.id.valid and self._frames_written is not None:
+      self.finish_data()
+    if self._overview is not None:
+      self._overview.close()
+      self._overview = None
+    super(Mea60_h5, self).close()
+    return
+  
+  
+  def dateticks(self):
+    #Tool to calculate the c# equivalent to DateTime.Ticks property.
+    #Current UTC time in ticks of .1 micro seconds since 01.01.0001 00:00 
+    return (datetime.utcnow() - datetime(1, 1, 1)).total_seconds() * 1e7
+
+  def get_overview(self, path = None, rebuild = False):
+    #Min/max overview pyramid of the electrode and analog data, read from
+    #the sidecar file <recording>.overview.hdf5 or built in one pass over the
+    #data if it is missing or outdated.
+    if self._overview is None or rebuild:
+      if self._overview is not None:
+        self._overview.close()
+      self._overview = OverviewPyramid.open(self, path, rebuild)
+    return self._overview
+
+  def _plot_window(self, stream, channel, xlim, n_frames, tick, pixels):
+    #Frames and values to plot for channel in the time window xlim (s):
+    #the samples for short windows, else the interleaved minima and maxima
+    #of the overview level matching the pixel width.
+    if xlim is None:
+      start, stop = 0, n_frames
+    else:
+      start = max(int(xlim[0]*1000000/tick), 0)
+      stop = min(int(np.ceil(xlim[1]*1000000/tick)), n_frames)
+    if pixels is None:
+      import matplotlib.pyplot as plt
+      pixels = max(int(plt.gca().get_window_extent().width), 1)
+    if (stop - start)/OVERVIEW_BASE >= pixels:
+      frames, low, high = self.get_overview().get(stream, channel, start, stop, pixels)
+      return np.repeat(frames, 2), np.column_stack((low, high)).ravel()
+    return np.arange(start, stop), None
+
+  def plot_raw_trace(self, electrode, xlim=None, pixels=None):
+    #xlim: time window in s, None for the whole recording.
+    #pixels: plot width, None for the width of the current axes.
+    import matplotlib.pyplot as plt
+    tick = self.info['Tick'][0]
+    frames, data = self._plot_window('electrode', electrode, xlim, self.datashape[1],
+                                     tick, pixels)
+    if data is None:
+      data=self.get_electrode(electrode, slice(frames[0], frames[-1] + 1))
+    t=frames*tick/1000000
+    plt.plot(t,data)
+    plt.xlim([t[0], t[-1]])
+    plt.xlabel("time (s)")
+    plt.ylabel("voltage [%s]"%self.units["voltage"])
+    plt.show()
+  
+  def plot_analog(self, xlim=None, pixels=None):
+      #xlim: time window in s, None for the whole recording.
+      #pixels: plot width, None for the width of the current axes.
+      import matplotlib.pyplot as plt
+      #fig, axs = plt.subplots(4,1)
+      #ylim=[-32765, -32768]
+      
+      ch = self.channels.index[0]
+      tick = self.channels["tick"][ch]
+      frames, y = self._plot_window('analog', ch, xlim, self.analog.shape[1], tick,
+                                    pixels)
+      if y is None:
+        #Only the window is read, unless the channel is cached anyway
+        if ch in self._analog_cache:
+          y=self._analog_cache[ch][frames[0]:frames[-1] + 1]
+        else:
+          y=self.analog[ch, frames[0]:frames[-1] + 1]
+      y=y.copy()
+      y[y == -32768] = 0
+      y[y == -32767] = 1
+      x=frames*tick/1000000
+      
+      plt.step(x,y)
+      plt.xlabel("time (s)")
+      plt.title('Analogic Data')
+    
+      plt.show()
+          
+  def get_trigger(self):
+      ch = self.channels.index[0]
+      y=self.get_analog(ch)
+      x=np.arange(0, self.channels["tick"][ch]*len(y), self.channels["tick"][ch])
+      
+      return x, y
+
+  def get_events(self):
+      #Times (s) of the trigger level changes read from the MCS EventStream,
+      #None if the file has no events. Events with a duration are pulses
+      #and give a rising and a falling edge each.
+      if self.event_path not in self:
+        return None
+      events = self[self.event_path][:]
+      if events.size == 0:
+        return None
+      timestamps = events[0]
+      if events.shape[0] > 1 and np.any(events[1] > 0):
+        timestamps = np.column_stack((timestamps, timestamps + events[1])).ravel()
+      return timestamps/1000000
+
+  def get_trigger_events(self, source = 'auto'):
+      #Level changes of the trigger, computed once and cached.
+      #source: 'events' reads the EventStream (the initial level is taken from
+      #the analog trigger channel), 'analog' scans the analog trigger channel,
+      #'auto' uses the events if available and falls back to the analog channel.
+      if self._trigger_events is None or source != self._trigger_events_source:
+        ch = self.channels.index[0]
+        tick = self.channels["tick"][ch]
+        times = self.get_events() if source != 'analog' else None
+        if times is not None:
+          events = TriggerEvents.from_times(times, tick, self.analog.shape[1],
+                                            starts_low = self._trigger_starts_low(ch, times, tick))
+        elif source == 'events':
+          raise KeyError("No events in %s"%self.event_path)
+        else:
+          events = TriggerEvents.from_signal(self.get_analog(ch), tick)
+        self._trigger_events = events
+        self._trigger_events_source = source
+      return self._trigger_events
+
+  def _trigger_starts_low(self, ch, times, tick):
+      #Whether the trigger starts at its low level, comparing the first sample
+      #of channel ch with one inside the segment after the first event, so
+      #only two samples are read.
+      n_frames = self.analog.shape[1]
+      edges = np.round(np.asarray(times[:2])*1000000/tick).astype(np.int64)
+      if n_frames == 0 or edges[0] >= n_frames:
+        return True
+      after = (edges[0] + (edges[1] if len(edges) > 1 else n_frames))//2
+      return bool(self.analog[ch, 0] <= self.analog[ch, min(after, n_frames - 1)])
+
+  def plot_trigger(self, events = None):
+      #Step plot of the trigger from its level changes only.
+      import matplotlib.pyplot as plt
+      if events is None:
+        events = self.get_trigger_events()
+      x, y = events.step()
+      plt.step(x, y, where = 'post')
+      plt.xlabel("time (s)")
+      plt.title('Trigger')
+      plt.show()
\ No newline at end of file
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Min/max overview pyramid of MEA recordings for fast trace plotting.
+
+Every level of the pyramid stores the minimum and maximum of every channel
+over bins of a fixed number of frames, the finest level OVERVIEW_BASE frames
+per bin and every further level OVERVIEW_FACTOR times more. All levels of
+the electrode and the analog data are built in one streaming pass over each
+dataset and stored in a sidecar h5 file next to the recording, so plotting
+a window of any length reads about as many values as there are pixels.
+"""
+
+import os
+
+import h5py
+import numpy as np
+
+# Frames per bin of the finest level
+OVERVIEW_BASE = 64
+# Decimation between consecutive levels
+OVERVIEW_FACTOR = 8
+# Levels are added until one has at most this many bins
+OVERVIEW_MIN_BINS = 1024
+# Frames read per hyperslab while building, a multiple of OVERVIEW_BASE
+OVERVIEW_CHUNK_FRAMES = 2**18
+
+
+# Suffix of the sidecar file, not ending in .h5 so globs like *.h5 over the
+# recordings do not pick it up
+SIDECAR_SUFFIX = '.overview.hdf5'
+
+
+def sidecar_path(filepath):
+    return os.path.splitext(filepath)[0] + SIDECAR_SUFFIX
+
+
+def _reduce(low, high, factor):
+    # Min of low and max of high over groups of factor columns, the last
+    # group may be partial.
+    groups = np.arange(0, low.shape[1], factor)
+    return (np.minimum.reduceat(low, groups, axis=1),
+            np.maximum.reduceat(high, groups, axis=1))
+
+
+def build_levels(dataset, group, base=OVERVIEW_BASE, factor=OVERVIEW_FACTOR,
+                 chunk_frames=OVERVIEW_CHUNK_FRAMES):
+    # Write the min/max levels of the channels x frames dataset into the h5
+    # group as level_k/min and level_k/max, reading dataset once.
+    n_channels, n_frames = dataset.shape
+    levels = []
+    decimation, n_bins = base, -(-n_frames//base)
+    while True:
+        level = group.create_group('level_%d'%len(levels))
+        level.attrs['decimation'] = decimation
+        levels.append((level.create_dataset('min', (n_channels, n_bins), dtype=dataset.dtype),
+                       level.create_dataset('max', (n_channels, n_bins), dtype=dataset.dtype)))
+        if n_bins <= OVERVIEW_MIN_BINS:
+            break
+        decimation, n_bins = decimation*factor, -(-n_bins//factor)
+
+    # Bins of every level not yet filling a group of the next level
+    carry = [None]*len(levels)
+    position = [0]*len(levels)
+    chunk_frames = max(chunk_frames//base, 1)*base
+    for first in range(0, n_frames, chunk_frames):
+        last = min(first + chunk_frames, n_frames)
+        block = dataset[:, first:last]
+        low, high = _reduce(block, block, base)
+        for k, (mins, maxs) in enumerate(levels):
+            if k > 0:
+                if carry[k] is not None:
+                    low = np.concatenate((carry[k][0], low), axis=1)
+                    high = np.concatenate((carry[k][1], high), axis=1)
+                full = low.shape[1] if last == n_frames else low.shape[1]//factor*factor
+                carry[k] = (low[:, full:], high[:, full:])
+                if full == 0:
+                    break
+                low, high = _reduce(low[:, :full], high[:, :full], factor)
+            mins[:, position[k]:position[k] + low.shape[1]] = low
+            maxs[:, position[k]:position[k] + low.shape[1]] = high
+            position[k] += low.shape[1]
+    return
+
+
+class OverviewPyramid():
+    # Min/max pyramid of the electrode and analog data of a Mea60_h5 file.
+    # Use Mea60_h5.get_overview() to open or build it.
+    def __init__(self, h5file):
+        self.file = h5file
+
+    @classmethod
+    def open(cls, meafile, path=None, rebuild=False):
+        # Open the sidecar file of meafile, (re)built if missing, outdated
+        # or rebuild is set. Falls back to an in-memory pyramid if the
+        # sidecar cannot be written.
+        path = sidecar_path(meafile.filepath) if path is None else path
+        source = cls._source_attrs(meafile)
+        if not rebuild and os.path.exists(path):
+            try:
+                h5file = h5py.File(path, 'r')
+            except OSError:
+                h5file = None
+            if h5file is not None:
+                if all(h5file.attrs.get(key) == value for key, value in source.items()):
+                    return cls(h5file)
+                h5file.close()
+        try:
+            h5file = h5py.File(path, 'w')
+        except OSError:
+            h5file = h5py.File(path, 'w', driver='core', backing_store=False)
+        cls.build(meafile, h5file)
+        h5file.attrs.update(source)
+        h5file.flush()
+        return cls(h5file)
+
+    @staticmethod
+    def build(meafile, h5file):
+        if hasattr(meafile, 'data'):
+            build_levels(meafile.get_source(), h5file.create_group('electrode'))
+        if hasattr(meafile, 'channels'):
+            build_levels(meafile.analog, h5file.create_group('analog'))
+        return
+
+    @staticmethod
+    def _source_attrs(meafile):
+        # Identify the recording and the pyramid settings, a sidecar not
+        # matching them is rebuilt.
+        stat = os.stat(meafile.filepath)
+        return {'source_size': stat.st_size, 'source_mtime': stat.st_mtime_ns,
+                'data_path': meafile.data_path, 'analog_path': meafile.analog_path,
+                'base': OVERVIEW_BASE, 'factor': OVERVIEW_FACTOR}
+
+    def decimations(self, stream):
+        # Frames per bin of the levels of stream ('electrode' or 'analog').
+        if stream not in self.file:
+            return []
+        group = self.file[stream]
+        return [int(group['level_%d'%k].attrs['decimation']) for k in range(len(group))]
+
+    def get(self, stream, channel, start, stop, pixels):
+        # Min/max of channel over the frames [start, stop) from the coarsest
+        # level with at least pixels bins in the window. Returns the first
+        # frame of every bin, the minima and the maxima, or None if even the
+        # finest level is too coarse and the samples should be plotted.
+        for k, decimation in reversed(list(enumerate(self.decimations(stream)))):
+            if (stop - start)/decimation >= pixels:
+                level = self.file[stream]['level_%d'%k]
+                first, last = start//decimation, -(-stop//decimation)
+                return (np.arange(first, last)*decimation,
+                        level['min'][channel, first:last], level['max'][channel, first:last])
+        return None
+
+    def close(self):
+        if self.file.id.valid:
+            self.file.close()
+        return
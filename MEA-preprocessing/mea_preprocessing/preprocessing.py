@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming preprocessing of MEA recordings.
+
+Band-pass filters and common average references (CAR) the electrode data of
+a Mea60_h5 file chunk by chunk and writes the result to a new file. The
+SOS filter state is started in steady state for the first frame of every
+electrode and carried from one chunk to the next, so the output is
+identical to filtering the whole recording at once, while the memory stays
+bounded by the chunk size. Reading the next chunk and writing the previous
+one run in a thread pool while the current chunk is filtered.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .mea60_h5 import Mea60_h5, CHUNK_FRAMES
+
+
+class StreamingFilter():
+    # Causal SOS band-pass filter with common average referencing over
+    # electrodes x frames blocks. Call process() on consecutive blocks.
+    # band: (low, high) cut-off frequencies in Hz, None for no filtering
+    # framerate: sampling rate in Hz
+    # car: subtract the median (or mean) over electrodes from every frame
+    # steady_start: start the filter state as if every electrode had been at
+    # its first value forever, so a DC offset gives no onset transient
+    # (which would cross spike thresholds), else start from zero
+    def __init__(self, n_electrodes, framerate, band=(300., 3000.), order=3,
+                 car='median', dtype=np.float32, steady_start=True):
+        self.dtype = np.dtype(dtype)
+        self.car = car
+        self.steady_start = steady_start
+        self.sos = None
+        self.zi = None
+        if band is not None:
+            from scipy import signal
+            self.sos = signal.butter(order, band, btype='bandpass', fs=framerate,
+                                     output='sos')
+            # Filter state per section and electrode, carried between blocks,
+            # with steady_start set from the first block
+            if not steady_start:
+                self.zi = np.zeros((self.sos.shape[0], n_electrodes, 2))
+
+    def process(self, block):
+        block = np.asarray(block, dtype=self.dtype)
+        if self.sos is not None:
+            from scipy import signal
+            if self.zi is None:
+                self.zi = signal.sosfilt_zi(self.sos)[:, np.newaxis, :] * \
+                    block[:, 0].astype(np.float64)[np.newaxis, :, np.newaxis]
+            block, self.zi = signal.sosfilt(self.sos, block, axis=1, zi=self.zi)
+            block = block.astype(self.dtype, copy=False)
+        if self.car == 'median':
+            block -= np.median(block, axis=0)
+        elif self.car == 'mean':
+            block -= np.mean(block, axis=0)
+        return block
+
+
+def filter_recording(source, destination, band=(300., 3000.), order=3, car='median',
+                     chunk_frames=CHUNK_FRAMES, dtype=np.float32, compression=None,
+                     workers=2):
+    # Filter the ChannelData of the Mea60_h5 file source into the new file
+    # destination (same InfoChannel, with ADZero 0 as the filtered data is
+    # centred on zero). Peak memory is a few chunks of electrodes x
+    # chunk_frames regardless of the recording length.
+    # Returns the path of the destination file.
+    with Mea60_h5(source, 'r') as meafile, Mea60_h5(destination, 'w') as output:
+        n_electrodes = meafile.datashape[0]
+        stage = StreamingFilter(n_electrodes, meafile.framerate*1000, band, order,
+                                car, dtype)
+        info = meafile.info[:]
+        if band is not None or car:
+            # The band-pass and the common reference remove the zero level
+            info['ADZero'] = 0
+        output.create_data(n_electrodes, dtype, info=info,
+                           chunk_frames=min(chunk_frames, 2**12),
+                           compression=compression)
+
+        chunks = meafile.iter_chunks(chunk_frames=chunk_frames)
+        # One thread reads ahead, one writes behind; h5py serializes the
+        # file access, the filtering releases the GIL.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending_read = executor.submit(next, chunks, None)
+            pending_write = None
+            while True:
+                chunk = pending_read.result()
+                if chunk is None:
+                    break
+                pending_read = executor.submit(next, chunks, None)
+                filtered = stage.process(chunk[1])
+                if pending_write is not None:
+                    pending_write.result()
+                pending_write = executor.submit(output.append_data, filtered)
+            if pending_write is not None:
+                pending_write.result()
+        output.finish_data()
+    return destination
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Binned spike counts (PSTH) of segmented trials.
+
+BinnedSpikeCounts turns trial-relative spike times, the spikes and offsets
+of the SpikeTrains returned by MEA_spykingCircus.segment_trials(), into
+units x trials x bins count arrays (see SpikeTrains.binned()).
+Every bin size is counted once and cached. Bin sizes that are integer
+multiples of the base bin are derived from the base counts by cumulative
+sum rebinning instead of recounting the spikes.
+"""
+
+import numpy as np
+
+from .spike_trains import offsets_from_lengths, segment_index
+
+# Units rebinned per block, bounds the int64 cumulative sums
+REBIN_UNITS = 64
+
+
+class BinnedSpikeCounts():
+    # spikes: flat trial-relative spike times in s
+    # offsets: array (units x trials+1), trial k of unit i is
+    #     spikes[offsets[i,k]:offsets[i,k+1]]
+    # duration: binned window in s, spikes in [0, duration) are counted and
+    #     the last bin may be partial
+    # base_bin: bin size in s other bin sizes are rebinned from, None to use
+    #     the first requested bin size
+    # dtype: count dtype, promoted if the counts do not fit
+    # sparse: return scipy.sparse CSR matrices of shape
+    #     (units*trials x bins) instead of dense arrays, for low rates
+    def __init__(self, spikes, offsets, duration, base_bin=None, dtype=np.uint16,
+                 sparse=False):
+        self.spikes = np.asarray(spikes, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.duration = duration
+        self.base_bin = base_bin
+        self.dtype = np.dtype(dtype)
+        self.sparse = sparse
+        self._segments = None
+        self._cache = {}
+
+    @classmethod
+    def from_intervals(cls, spike_times, spike_units, starts, stops, n_units=None,
+                       **kwargs):
+        # Segment flat spike times (s) of units 0..n-1 into the trials
+        # [starts, stops]. The window is the shortest trial.
+        spike_times = np.asarray(spike_times, dtype=np.float64)
+        spike_units = np.asarray(spike_units, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.float64)
+        stops = np.asarray(stops, dtype=np.float64)
+        if n_units is None:
+            n_units = spike_units.max() + 1 if spike_units.size else 0
+        n_trials = len(starts)
+
+        trial = np.searchsorted(starts, spike_times, side='right') - 1
+        valid = trial >= 0
+        trial = np.where(valid, trial, 0)
+        valid &= spike_times <= stops[trial]
+        segment = spike_units[valid]*n_trials + trial[valid]
+        order = np.argsort(segment, kind='stable')
+        spikes = (spike_times[valid] - starts[trial[valid]])[order]
+
+        counts = np.bincount(segment, minlength=n_units*n_trials)
+        offsets = offsets_from_lengths(counts.reshape(n_units, n_trials))
+        duration = np.min(stops - starts) if n_trials else 0.0
+        return cls(spikes, offsets, duration, **kwargs)
+
+    @property
+    def n_units(self):
+        return self.offsets.shape[0]
+
+    @property
+    def n_trials(self):
+        return self.offsets.shape[1] - 1
+
+    def n_bins(self, bin_size):
+        return int(np.ceil(self.duration/bin_size - 1e-9))
+
+    def counts(self, bin_size):
+        # Spike counts (units x trials x bins) for bin_size in s.
+        key = round(bin_size, 12)
+        if key not in self._cache:
+            if self.base_bin is None:
+                self.base_bin = bin_size
+            factor = bin_size/self.base_bin
+            if key != round(self.base_bin, 12) and factor > 1 and \
+                    np.isclose(factor, np.round(factor)):
+                counts = self._rebin(self.counts(self.base_bin), int(np.round(factor)))
+            else:
+                counts = self._count(bin_size)
+            self._cache[key] = counts
+        return self._cache[key]
+
+    def rates(self, bin_size):
+        # Firing rates (Hz), dense.
+        counts = self.counts(bin_size)
+        if self.sparse:
+            counts = counts.toarray().reshape(self.n_units, self.n_trials, -1)
+        return counts/bin_size
+
+    def _segment_index(self):
+        # Unit*trials + trial of every spike.
+        if self._segments is None:
+            self._segments = segment_index(self.offsets)
+        return self._segments
+
+    def _count(self, bin_size):
+        # Count all spikes once into bins of bin_size.
+        n_bins = self.n_bins(bin_size)
+        segments = self._segment_index()
+        valid = (self.spikes >= 0) & (self.spikes < self.duration)
+        bins = np.minimum((self.spikes[valid]/bin_size).astype(np.int64), n_bins - 1)
+        shape = (self.n_units*self.n_trials, n_bins)
+        if self.sparse:
+            from scipy import sparse
+            counts = sparse.coo_matrix((np.ones(bins.size, dtype=np.int64),
+                                        (segments[valid], bins)), shape=shape).tocsr()
+            return counts.astype(self._fitting_dtype(counts.max() if counts.nnz else 0))
+        counts = np.bincount(segments[valid]*n_bins + bins, minlength=shape[0]*n_bins)
+        counts = counts.astype(self._fitting_dtype(counts.max() if counts.size else 0))
+        return counts.reshape(self.n_units, self.n_trials, n_bins)
+
+    def _rebin(self, base, factor):
+        # Sum groups of factor base bins, the last group may be partial.
+        n_base = base.shape[-1]
+        n_bins = -(-n_base//factor)
+        if self.sparse:
+            from scipy import sparse
+            groups = sparse.csr_matrix((np.ones(n_base, dtype=np.int64),
+                                        (np.arange(n_base), np.arange(n_base)//factor)),
+                                       shape=(n_base, n_bins))
+            counts = (base @ groups).tocsr()
+            return counts.astype(self._fitting_dtype(counts.max() if counts.nnz else 0))
+        edges = np.minimum(np.arange(n_bins + 1)*factor, n_base)
+        counts = np.empty(base.shape[:-1] + (n_bins,), dtype=np.int64)
+        for first in range(0, base.shape[0], REBIN_UNITS):
+            block = base[first:first + REBIN_UNITS]
+            cumulative = np.zeros(block.shape[:-1] + (n_base + 1,), dtype=np.int64)
+            np.cumsum(block, axis=-1, out=cumulative[..., 1:])
+            counts[first:first + REBIN_UNITS] = np.diff(cumulative[..., edges], axis=-1)
+        return counts.astype(self._fitting_dtype(counts.max() if counts.size else 0))
+
+    def _fitting_dtype(self, maximum):
+        if self.dtype.kind in 'iu' and maximum > np.iinfo(self.dtype).max:
+            return np.promote_types(self.dtype, np.min_scalar_type(maximum))
+        return self.dtype
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Response quality index (QI) of sorted units.
+
+The firing rate of every unit is binned in every stimulus trial, then
+SD1 = mean over trials of the standard deviation over bins,
+SD2 = standard deviation over bins of the trial-averaged rate,
+QI = SD2 / SD1.
+The counts of all units and trials come from one psth.BinnedSpikeCounts
+tensor (units x trials x bins).
+"""
+
+import numpy as np
+
+from .psth import BinnedSpikeCounts
+
+
+def trial_intervals(events):
+    # (starts, stops) in s of the stimulus trials of a TriggerEvents, one
+    # trial from every rising edge to the next.
+    rising = events.rising*events.tick/1000000
+    return rising[:-1], rising[1:]
+
+
+def quality_index(counts, bin_size):
+    # DataFrame with SD1, SD2 and QI of every unit from counts
+    # (units x trials x bins).
+    import pandas as pd
+    rates = counts/bin_size
+    sd1 = np.mean(np.std(rates, axis=2), axis=1)
+    sd2 = np.std(np.mean(rates, axis=1), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        qi = np.where(sd1 != 0, sd2/sd1, np.nan)
+    return pd.DataFrame({'SD1': sd1, 'SD2': sd2, 'QI': qi})
+
+
+def compute_quality_index(spike_frames, spike_clusters, meafile, bin_size=0.128):
+    # QI of every cluster from spike times in frames (e.g. spike_times.npy
+    # and spike_clusters.npy of a phy export) and the trigger of the
+    # Mea60_h5 recording meafile. Returns a DataFrame indexed by cluster.
+    import pandas as pd
+    cluster_ids, spike_units = np.unique(spike_clusters, return_inverse=True)
+    spike_times = np.asarray(spike_frames).ravel()/(meafile.framerate*1000)
+    starts, stops = trial_intervals(meafile.get_trigger_events())
+    binned = BinnedSpikeCounts.from_intervals(spike_times, spike_units.ravel(),
+                                              starts, stops, n_units=len(cluster_ids))
+    results = quality_index(binned.counts(bin_size), bin_size)
+    results.index = pd.Index(cluster_ids, name='cluster')
+    return results
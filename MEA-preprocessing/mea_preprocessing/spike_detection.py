@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Threshold-crossing spike detection for a quick look before sorting.
+
+Detects negative threshold crossings of the band-pass filtered electrode
+data of a Mea60_h5 file chunk by chunk. The threshold is a multiple of the
+noise of every electrode, estimated by the median absolute deviation.
+The spike times are returned as {'temp_i': frames}, the format of the
+SpyKING CIRCUS results, so the multi-unit activity can be analysed with
+MEA_spykingCircus(filename, spiketimes=...).
+"""
+
+import numpy as np
+
+from .mea60_h5 import CHUNK_FRAMES
+from .preprocessing import StreamingFilter
+
+# MAD of a standard normal distribution
+MAD_TO_SD = 0.6745
+
+
+def estimate_noise(meafile, band=(300., 3000.), noise_frames=10*CHUNK_FRAMES,
+                   electrodes=None):
+    # Noise (MAD/0.6745) of every electrode over the first noise_frames
+    # frames of the filtered data.
+    stage = None
+    noise = []
+    n_frames = min(noise_frames, meafile.datashape[1])
+    for _, block in meafile.iter_chunks(electrodes, 0, n_frames, n_frames):
+        if stage is None:
+            stage = StreamingFilter(block.shape[0], meafile.framerate*1000, band,
+                                    car=None)
+        block = stage.process(block)
+        median = np.median(block, axis=1, keepdims=True)
+        noise = np.median(np.abs(block - median), axis=1)/MAD_TO_SD
+    return np.asarray(noise)
+
+
+def detect_spikes(meafile, threshold=5., refractory=0.001, band=(300., 3000.),
+                  chunk_frames=CHUNK_FRAMES, electrodes=None, noise=None):
+    # Spike times in frames of every electrode as {'temp_i': array}, i is
+    # the position in electrodes (the electrode index for all electrodes).
+    # threshold: in multiples of the noise, refractory: dead time in s after
+    # a spike. The filter state, the last sample and the last spike of every
+    # electrode are carried over, so chunk boundaries do not matter.
+    if noise is None:
+        noise = estimate_noise(meafile, band, electrodes=electrodes)
+    levels = -threshold*np.asarray(noise, dtype=np.float32)
+    dead_frames = int(np.round(refractory*meafile.framerate*1000))
+    n_electrodes = len(levels)
+
+    stage = StreamingFilter(n_electrodes, meafile.framerate*1000, band, car=None)
+    previous = np.zeros(n_electrodes, dtype=np.float32)
+    last_spike = np.full(n_electrodes, -dead_frames - 1, dtype=np.int64)
+    spikes = [[] for _ in range(n_electrodes)]
+    first_chunk = True
+    for first, block in meafile.iter_chunks(electrodes, chunk_frames=chunk_frames):
+        block = stage.process(block)
+        below = block < levels[:, np.newaxis]
+        before = np.empty_like(below)
+        before[:, 1:] = below[:, :-1]
+        before[:, 0] = first_chunk or previous < levels
+        electrode, frame = np.nonzero(below & ~before)
+        frame = frame + first
+        for e in np.unique(electrode):
+            kept = _apply_dead_time(frame[electrode == e], last_spike[e], dead_frames)
+            if kept.size:
+                spikes[e].append(kept)
+                last_spike[e] = kept[-1]
+        previous = block[:, -1]
+        first_chunk = False
+    return {f'temp_{i}': np.concatenate(times) if times else np.zeros(0, dtype=np.int64)
+            for i, times in enumerate(spikes)}
+
+
+def _apply_dead_time(crossings, last_spike, dead_frames):
+    # Drop crossings within dead_frames after the previous kept spike.
+    if crossings[0] - last_spike > dead_frames and \
+            np.all(np.diff(crossings) > dead_frames):
+        return crossings
+    kept = []
+    for crossing in crossings:
+        if crossing - last_spike > dead_frames:
+            kept.append(crossing)
+            last_spike = crossing
+    return np.array(kept, dtype=np.int64)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Compact storage of spike trains of many units and trials.
+
+SpikeTrains keeps all spikes in one flat array ordered by unit, then trial,
+and a units x trials+1 offset array: trial k of unit i is
+spikes[offsets[i,k]:offsets[i,k+1]]. Selections, windowed counts and rates
+work on the flat arrays without building per-trial Python objects. For code
+written against the former list (units) of lists (trials) of arrays,
+trains[i] still gives the list of trial arrays of unit i and trains[i][k]
+the spikes of one trial.
+"""
+
+import numbers
+
+import numpy as np
+
+
+def offsets_from_lengths(lengths):
+    # Offsets (units x trials+1) of segments with the given lengths (units x
+    # trials) stored one after another.
+    lengths = np.asarray(lengths)
+    n_units, n_trials = lengths.shape
+    flat_offsets = np.concatenate(([0], np.cumsum(lengths.ravel())))
+    return flat_offsets[np.arange(n_units)[:, np.newaxis]*n_trials
+                        + np.arange(n_trials + 1)].astype(np.int64)
+
+
+def segment_index(offsets):
+    # Unit*trials + trial of every spike of the offsets (units x trials+1).
+    lengths = np.diff(offsets, axis=1).ravel()
+    return np.repeat(np.arange(lengths.size), lengths)
+
+
+class SpikeTrains():
+    # spikes: flat spike times in s, or sample indices if rate is given
+    # offsets: array (units x trials+1), trial k of unit i is
+    #     spikes[offsets[i,k]:offsets[i,k+1]], or offsets (units+1) for
+    #     a single trial per unit
+    # rate: sampling rate in Hz of sample index spikes, None for times in s
+    __slots__ = ('spikes', 'offsets', 'rate', '_segments')
+
+    def __init__(self, spikes, offsets, rate=None):
+        self.spikes = np.asarray(spikes)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if self.offsets.ndim == 1:
+            self.offsets = np.column_stack((self.offsets[:-1], self.offsets[1:]))
+        self.rate = rate
+        self._segments = None
+
+    @classmethod
+    def from_lists(cls, trains, rate=None):
+        # From a list (units) of lists (trials) of spike arrays. Every unit
+        # needs the same number of trials.
+        lengths = np.array([[len(trial) for trial in unit] for unit in trains],
+                           dtype=np.int64).reshape(len(trains), -1)
+        flat = [trial for unit in trains for trial in unit]
+        spikes = np.concatenate(flat) if flat else np.zeros(0)
+        return cls(spikes, offsets_from_lengths(lengths), rate)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            rate = float(arrays['rate']) if arrays['rate'].size else None
+            return cls(arrays['spikes'], arrays['offsets'], rate)
+
+    def save(self, path):
+        # Store spikes, offsets and rate in a single npz file.
+        rate = np.array([] if self.rate is None else self.rate, dtype=np.float64)
+        np.savez(path, spikes=self.spikes, offsets=self.offsets, rate=rate)
+
+    @property
+    def n_units(self):
+        return self.offsets.shape[0]
+
+    @property
+    def n_trials(self):
+        return self.offsets.shape[1] - 1
+
+    @property
+    def times(self):
+        # Spike times in s.
+        if self.rate is None:
+            return self.spikes
+        return self.spikes/self.rate
+
+    def __len__(self):
+        return self.n_units
+
+    def __iter__(self):
+        for unit in range(self.n_units):
+            yield self[unit]
+
+    def __getitem__(self, key):
+        # trains[i]: list of the trial arrays of unit i
+        # trains[i, k]: spikes of trial k of unit i
+        # trains[units, trials] with slices or index arrays: SpikeTrains
+        units, trials = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(units, numbers.Integral):
+            row = self.offsets[units]
+            if isinstance(trials, numbers.Integral):
+                trials = range(self.n_trials)[trials]
+                return self.spikes[row[trials]:row[trials + 1]]
+            return [self.spikes[row[k]:row[k + 1]] for k in range(self.n_trials)[trials]]
+        return self.select(units, trials)
+
+    def select(self, units=slice(None), trials=slice(None)):
+        # SpikeTrains of a subset of units and trials (slices or index
+        # arrays), in the given order.
+        units = np.arange(self.n_units)[units]
+        trials = np.arange(self.n_trials)[trials]
+        starts = self.offsets[np.ix_(units, trials)]
+        stops = self.offsets[np.ix_(units, trials + 1)]
+        lengths = stops - starts
+        # Index of every selected spike: its segment start shifted by its
+        # position within the segment
+        shift = np.repeat(starts.ravel() - np.cumsum(lengths.ravel()) + lengths.ravel(),
+                          lengths.ravel())
+        index = shift + np.arange(shift.size)
+        return SpikeTrains(self.spikes[index], offsets_from_lengths(lengths),
+                           self.rate)
+
+    def to_lists(self):
+        # List (units) of lists (trials) of arrays.
+        return [self[unit] for unit in range(self.n_units)]
+
+    def segment_index(self):
+        # Unit*trials + trial of every spike.
+        if self._segments is None:
+            self._segments = segment_index(self.offsets)
+        return self._segments
+
+    def counts(self, start=None, stop=None):
+        # Spike counts (units x trials) in the window [start, stop) in s,
+        # None for no bound.
+        if start is None and stop is None:
+            return np.diff(self.offsets, axis=1)
+        times = self.times
+        inside = np.ones(times.shape, dtype=bool)
+        if start is not None:
+            inside &= times >= start
+        if stop is not None:
+            inside &= times < stop
+        counts = np.bincount(self.segment_index()[inside],
+                             minlength=self.n_units*self.n_trials)
+        return counts.reshape(self.n_units, self.n_trials)
+
+    def rates(self, start, stop):
+        # Firing rates (Hz, units x trials) in the window [start, stop) in s.
+        return self.counts(start, stop)/(stop - start)
+
+    def binned(self, duration, **kwargs):
+        # BinnedSpikeCounts of the window [0, duration) s of every trial.
+        from .psth import BinnedSpikeCounts
+        return BinnedSpikeCounts(self.times, self.offsets, duration, **kwargs)
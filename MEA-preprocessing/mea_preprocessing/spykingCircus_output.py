@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov 27 16:32:12 2024
+
+@author: julio
+"""
+
+import numpy as np
+import os
+import hashlib
+
+# pandas, scipy and the circus package are imported where they are used,
+# so importing this module stays fast for worker processes.
+from . import mea60_h5 as MEA60
+from . import quality_index as QI
+from .spike_trains import SpikeTrains, offsets_from_lengths
+
+
+# Version of the arrays stored by ResultCache, part of the cache key. Bump it
+# when the trigger detection, trial segmentation or anything else cached
+# changes, so old caches are recomputed.
+CACHE_VERSION = 2
+# Source of the trigger events, see Mea60_h5.get_trigger_events
+TRIGGER_SOURCE = 'auto'
+
+# Spike windows closer than this (frames) are read together, up to
+# WAVEFORM_READ_FRAMES frames per read
+WAVEFORM_READ_GAP = 2**12
+WAVEFORM_READ_FRAMES = 2**16
+
+
+def coalesce_windows(starts, length, max_gap=WAVEFORM_READ_GAP,
+                     max_frames=WAVEFORM_READ_FRAMES):
+    # Group sorted windows [start, start+length) into few large reads.
+    # Returns a list of (first, last, index of the first window, index
+    # after the last window).
+    reads = []
+    first_window = 0
+    for i in range(1, len(starts) + 1):
+        if i == len(starts) or starts[i] - starts[i - 1] - length > max_gap or \
+                starts[i] + length - starts[first_window] > max_frames:
+            reads.append((starts[first_window], starts[i - 1] + length, first_window, i))
+            first_window = i
+    return reads
+
+
+class ResultCache():
+    # On-disk (npz) and in-memory cache of the arrays derived from a sorted
+    # recording. Stored entries are only used if they were written with the
+    # same key. With path None nothing is persisted or shared.
+    _memory = {}
+    
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        arrays = ResultCache._memory.get(path) if path is not None else None
+        if arrays is None or str(arrays['key']) != key:
+            arrays = self._read()
+        if path is not None:
+            ResultCache._memory[path] = arrays
+        self.arrays = arrays
+    
+    def _read(self):
+        empty = {'key': np.array(self.key)}
+        if self.path is None or not os.path.exists(self.path):
+            return empty
+        try:
+            with np.load(self.path) as cachefile:
+                arrays = {name: cachefile[name] for name in cachefile.files}
+        except (OSError, ValueError):
+            return empty
+        if str(arrays.get('key')) != self.key:
+            return empty
+        return arrays
+    
+    def get(self, *names):
+        # Cached arrays for names, None if any of them is missing.
+        if not all(name in self.arrays for name in names):
+            return None
+        return [self.arrays[name] for name in names]
+    
+    def update(self, **arrays):
+        self.arrays.update(arrays)
+        if self.path is None:
+            return
+        # Write to a temporary file first so readers never see partial files
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as cachefile:
+                np.savez(cachefile, **self.arrays)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Read-only location: keep the in-memory entries only
+            print("Could not write result cache %s"%self.path)
+
+
+class MEA_spykingCircus():
+    def __init__(self, filename, *args, align_waveforms=True, use_cache=True,
+                 spiketimes=None, **argv):
+        # spiketimes: {'temp_i': frames} to analyse instead of the SpyKING
+        # CIRCUS results, e.g. spike_detection.detect_spikes(). Nothing is
+        # cached on disk then.
+        print("\n MEA_spykingCircus init: %s"%filename)
+        if spiketimes is None:
+            from circus.shared.parser import CircusParser
+            params = CircusParser(filename)
+        else:
+            params = None
+        self.filename=filename
+        meafile=MEA60.Mea60_h5(self.filename, "r")
+        
+        self.meafile = meafile
+        self.params=params
+        self.align_waveforms = align_waveforms
+        self.OOindex = None
+        self.binned = None
+        
+        if spiketimes is not None:
+            self.result_file = None
+            self.cache = ResultCache(None, None)
+            self._store_spiketimes([np.asarray(spiketimes[f'temp_{i}'])
+                                    for i in range(len(spiketimes))])
+            return
+        
+        # Results, trigger events and trials are cached next to the results
+        file_out_suff = params.get('data', 'file_out_suff')
+        self.result_file = file_out_suff + '.result.hdf5'
+        cache_path = file_out_suff + '.mea_cache.npz' if use_cache else None
+        self.cache = ResultCache(cache_path, self.cache_key())
+        
+    
+    def cache_key(self):
+        # Hash of the cache version, the trigger source and streams, the
+        # result and raw files (path, mtime, size) and the CircusParser
+        # parameters.
+        parts = ["version=%d"%CACHE_VERSION,
+                 "trigger=%s:%s:%s"%(TRIGGER_SOURCE, self.meafile.analog_path,
+                                     self.meafile.event_path if self.meafile.event_path
+                                     in self.meafile else 'no events')]
+        for path in (self.result_file, self.filename):
+            path = os.path.abspath(path)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                parts.append("%s:%d:%d"%(path, stat.st_mtime_ns, stat.st_size))
+            else:
+                parts.append("%s:missing"%path)
+        for section in sorted(self.params.parser.sections()):
+            for key, value in sorted(self.params.parser.items(section, raw=True)):
+                parts.append("%s.%s=%s"%(section, key, value))
+        return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+    
+    
+    def load_results(self):
+        # Spike times (frames) per template as {'temp_i': array}, loaded
+        # from SpyKING CIRCUS only if not cached.
+        trains = self.get_spike_trains()
+        return {f'temp_{i}': trains[i, 0] for i in range(trains.n_units)}
+    
+    
+    def get_spike_trains(self):
+        # Spike times (frames) of all templates as SpikeTrains with a single
+        # trial, loaded from SpyKING CIRCUS only if not cached.
+        cached = self.cache.get('spiketimes', 'spiketimes_offsets')
+        if cached is None:
+            from circus.shared.files import load_data
+            results = load_data(self.params, 'results')
+            cached = self._store_spiketimes([np.asarray(results['spiketimes'][f'temp_{i}'])
+                                             for i in range(len(results["spiketimes"]))])
+        spiketimes, offsets = cached
+        return SpikeTrains(spiketimes, offsets, rate=self.meafile.framerate*1000)
+    
+    
+    def _store_spiketimes(self, spiketimes):
+        # Cache a list of per-template spike time arrays as flat array and
+        # offsets.
+        lengths = [len(times) for times in spiketimes]
+        flat = np.concatenate(spiketimes) if spiketimes else np.zeros(0)
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self.cache.update(spiketimes=flat, spiketimes_offsets=offsets)
+        return flat, offsets
+    
+    
+    def get_trigger_events(self):
+        # TriggerEvents of the recording, shared by the trial segmentation,
+        # the metrics and plotting.
+        cached = self.cache.get('trigger_edges', 'trigger_levels', 'trigger_info')
+        if cached is None:
+            events = self.meafile.get_trigger_events(TRIGGER_SOURCE)
+            self.cache.update(trigger_edges=events.edges, trigger_levels=events.levels,
+                              trigger_info=np.array([events.tick, events.n_frames]))
+            return events
+        edges, levels, (tick, n_frames) = cached
+        return MEA60.TriggerEvents(edges, levels, tick, n_frames)
+        
+    def get_time_vector(self):
+        # Durations (s) of the two alternating trigger conditions and the
+        # times (s) of all trigger level changes.
+        events = self.get_trigger_events()
+        stimuli_duration = self.meafile.duration/1000000
+        time_cond_changes = events.times
+        
+        time_differences = np.diff(np.insert(time_cond_changes, 0, 0))
+
+        time_differences_cond1 = time_differences[::2]
+        time_differences_cond2 = time_differences[1::2]
+
+        last_duration = stimuli_duration-time_cond_changes[-1]
+
+        time_differences_cond2 = np.append(time_differences_cond2, last_duration)
+
+        differences_time = {'cond1': time_differences_cond1, 'cond2': time_differences_cond2}
+        
+        return  differences_time, time_cond_changes
+        
+        
+        
+    def get_trials(self):
+        # Trial-relative spike times (s) as SpikeTrains, trials[i][k] are
+        # the spikes of trial k of template i, see segment_trials().
+        return self.segment_trials()
+    
+    
+    def segment_trials(self):
+        # Split the spike times of every template into trials in one pass.
+        # Trials start at the rising edges of the trigger, the first one at
+        # the end of the spontaneous period (last frame before the first
+        # rising edge), the last one is open ended. Spontaneous spikes are
+        # dropped. Returns the trial-relative spike times (s) as
+        # SpikeTrains (templates x trials).
+        
+        cached = self.cache.get('trial_spikes', 'trial_offsets')
+        if cached is not None:
+            return SpikeTrains(*cached)
+        
+        # Load results
+        results = self.get_spike_trains()
+        n_templates = results.n_units
+    
+        # Scale spike times, sorted within every template
+        templates = results.segment_index()
+        order = np.lexsort((results.spikes, templates))
+        times = results.times[order]
+    
+        # Rising edges of the trigger
+        events = self.get_trigger_events()
+        change_indices_analog = events.rising
+        
+        # Trial boundaries: end of the spontaneous period, then every
+        # following rising edge
+        spont_index = (change_indices_analog[0] - 1)*events.tick/1000000
+        boundaries = np.insert(change_indices_analog[1:]*events.tick/1000000, 0, spont_index)
+        n_trials = len(boundaries)
+        
+        event_related = times > spont_index
+        times = times[event_related]
+        templates = templates[event_related]
+        trial = np.searchsorted(boundaries, times, side='right') - 1
+        spikes = times - boundaries[trial]
+        
+        # Spikes are ordered by template, then time, hence by segment
+        segment = templates*n_trials + trial
+        counts = np.bincount(segment, minlength=n_templates*n_trials)
+        offsets = offsets_from_lengths(counts.reshape(n_templates, n_trials))
+        
+        self.cache.update(trial_spikes=spikes, trial_offsets=offsets)
+        return SpikeTrains(spikes, offsets)
+    
+    
+    
+    def compute_OOindex(self, templateid):
+        # ON-OFF index of a single template, looked up from the table of
+        # compute_OOindex_all().
+        return self.compute_OOindex_all()['OOi'].iloc[templateid]
+    
+    
+    def compute_OOindex_all(self):
+        # ON-OFF index of every template from a single segmentation.
+        # Returns a DataFrame indexed by template with the OOi and the
+        # average onset/offset rates (Hz), cached for later calls.
+        if self.OOindex is not None:
+            return self.OOindex
+        import pandas as pd
+        from scipy import stats as st
+        
+        trials = self.segment_trials()
+        events = self.get_trigger_events()
+        
+        time_changes, time_durs = self.get_time_vector()
+        mode_cond1 = st.mode(time_changes['cond1'])
+        mode_cond2 = st.mode(time_changes['cond2'])
+        max_value = int(np.round(mode_cond1.mode)+np.round(mode_cond2.mode))
+        
+        # Both conditions last half a trial
+        dur_stim = max_value/2
+        
+        # Spike counts in the first and second half of every trial
+        first_half = trials.counts(stop=dur_stim)
+        second_half = trials.counts(start=dur_stim)
+        
+        if(events.starts_low):
+            onset_counts, offset_counts = first_half, second_half
+        else:
+            onset_counts, offset_counts = second_half, first_half
+        
+        # The last trial is open ended and not included
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average_onset_rate = np.mean(onset_counts[:, :-1] / dur_stim, axis=1)
+            average_offset_rate = np.mean(offset_counts[:, :-1] / dur_stim, axis=1)
+            OOi = (average_onset_rate-average_offset_rate)/(average_onset_rate+average_offset_rate)
+        
+        self.OOindex = pd.DataFrame({'OOi': np.round(OOi, 2),
+                                     'onset_rate': average_onset_rate,
+                                     'offset_rate': average_offset_rate})
+        self.OOindex.index.name = 'template'
+        return self.OOindex
+    
+    
+    def get_binned_counts(self):
+        # BinnedSpikeCounts of the segmented trials, shared by the metrics so
+        # every bin size is counted only once. The window is the shortest
+        # trial, the last (open ended) trial is included.
+        if self.binned is None:
+            events = self.get_trigger_events()
+            duration = np.min(np.diff(events.rising))*events.tick/1000000
+            self.binned = self.segment_trials().binned(duration)
+        return self.binned
+    
+    
+    def compute_QI_all(self, bin_size=0.128):
+        # Response quality index (SD1, SD2, QI) of every template, trials
+        # from one rising trigger edge to the next, see quality_index.py.
+        # The last trial is open ended and not included.
+        counts = self.get_binned_counts().counts(bin_size)[:, :-1]
+        table = QI.quality_index(counts, bin_size)
+        table.index.name = 'template'
+        return table
+    
+    
+    def get_waveforms(self, templates=None, n_spikes=100, window=(-0.001, 0.002),
+                      channels=None, align=None, align_margin=0.0005, out=None):
+        # Raw spike-centred snippets as array (units x spikes x channels x
+        # samples), float32, NaN where a unit has fewer spikes or a window
+        # leaves the recording.
+        # templates: template indices (default all), n_spikes: snippets per
+        # template, evenly spread over its spikes, window: (start, stop) in s
+        # relative to the spike, channels: electrodes (default all),
+        # align: shift every snippet so its trough on the template's
+        # strongest channel is at the spike time, searched within
+        # align_margin s (default align_waveforms), out: file name to store
+        # the snippets as .npy memmap instead of in memory.
+        # Windows are sorted and coalesced into few large reads, with align
+        # the data is read twice (unit means, then the aligned snippets).
+        if align is None:
+            align = self.align_waveforms
+        results = self.load_results()
+        if templates is None:
+            templates = range(len(results))
+        templates = list(templates)
+        rate = self.meafile.framerate*1000
+        pre, post = int(np.round(window[0]*rate)), int(np.round(window[1]*rate))
+        margin = int(np.round(align_margin*rate)) if align else 0
+        length = post - pre
+        n_channels = self.meafile.datashape[0] if channels is None else len(np.atleast_1d(channels))
+        
+        shape = (len(templates), n_spikes, n_channels, length)
+        if out is None:
+            waveforms = np.full(shape, np.nan, dtype=np.float32)
+        else:
+            waveforms = np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=shape)
+            waveforms[...] = np.nan
+        
+        # Selected spikes of all templates, sorted by time
+        units, indices, spikes = [], [], []
+        for u, template in enumerate(templates):
+            times = np.sort(results[f'temp_{template}'])
+            if len(times) > n_spikes:
+                times = times[np.linspace(0, len(times) - 1, n_spikes).astype(np.int64)]
+            units.append(np.full(len(times), u))
+            indices.append(np.arange(len(times)))
+            spikes.append(times.astype(np.int64))
+        units = np.concatenate(units) if units else np.zeros(0, dtype=np.int64)
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+        starts = (np.concatenate(spikes) if spikes else np.zeros(0, dtype=np.int64)) + pre - margin
+        order = np.argsort(starts, kind='stable')
+        units, indices, starts = units[order], indices[order], starts[order]
+        
+        # Snippets including the alignment margin, read in coalesced blocks
+        # and written straight into waveforms, so only one block is held
+        padded = length + 2*margin
+        n_frames = self.meafile.datashape[1]
+        def padded_snippets():
+            for first, last, i, j in coalesce_windows(starts, padded):
+                read_first, read_last = max(first, 0), min(last, n_frames)
+                _, block = next(self.meafile.iter_chunks(channels, read_first, read_last,
+                                                         read_last - read_first))
+                for k in range(i, j):
+                    if starts[k] >= 0 and starts[k] + padded <= n_frames:
+                        yield k, block[:, starts[k] - read_first:starts[k] - read_first + padded]
+        
+        if align:
+            # First pass: mean snippet of every unit, its deepest channel
+            # (trough below the channel's median, so offsets do not count)
+            # is searched for the trough in the second pass
+            sums = np.zeros((len(templates), n_channels, padded))
+            counts = np.zeros(len(templates), dtype=np.int64)
+            for k, snippet in padded_snippets():
+                sums[units[k]] += snippet
+                counts[units[k]] += 1
+            strongest = np.zeros(len(templates), dtype=np.int64)
+            for u in np.flatnonzero(counts):
+                mean = sums[u]/counts[u]
+                mean -= np.median(mean, axis=1, keepdims=True)
+                strongest[u] = np.argmin(mean.min(axis=1))
+            center = margin - pre
+        for k, snippet in padded_snippets():
+            shift = 0
+            if align:
+                # Trough within the margin on the unit's strongest channel
+                search = snippet[strongest[units[k]], center - margin:center + margin + 1]
+                shift = np.argmin(search) - margin
+            waveforms[units[k], indices[k]] = snippet[:, margin + shift:margin + shift + length]
+        return waveforms
@@ -0,0 +1,192 @@
+"""
+@File    :   command_worker.py
+@Version :   1.0
+@License :   <>
+@Desc    :   Background command queue for a single stage, coalescing jog commands
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Hashable, Optional
+
+
+class CommandWorker:
+    """
+    Executes the commands of one device in order on a background thread,
+    so the joystick event thread never waits for the USB round-trips.
+
+    Jog commands with the same key that are still queued are merged into a
+    single command moving by the summed amount (opposite jogs cancel), so
+    a fast key repeater results in one move to the net target instead of a
+    backlog of small moves. The queue is bounded: when it is full, new jogs
+    can only be merged into pending ones and other commands replace the
+    oldest pending jog.
+    The device position is not read after every command: once no command
+    came for refresh_interval seconds it is read on that interval until two
+    reads agree, i.e. the device has stopped. Until then get_position()
+    returns the commanded target of the device.
+    """
+    def __init__(self, name: str, position: Optional[Callable] = None,
+                 target: Optional[Callable] = None, maxsize: int = 8,
+                 refresh_interval: float = 0.5) -> None:
+        """
+        Parameters
+        ---------
+        str name: name of the device, used for the thread and messages
+        Callable position: reads the device position, None for no caching
+        Callable target: returns the commanded target of the device (no device access),
+            None if it is unknown
+        int maxsize: maximum number of queued commands
+        float refresh_interval: seconds between position reads while the device settles
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.refresh_interval = refresh_interval
+        self._position_func = position
+        self._target_func = target
+        # read once here, afterwards only by the worker thread
+        self.position = position() if position is not None else None
+        # False after a command until the position reads agree again
+        self._settled = True
+        self._last_activity = time.monotonic()
+        # entries: [key (None for no jog), amount, function, args, kwargs]
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"{name} commands", daemon=True)
+        self._thread.start()
+
+    def jog(self, key: Hashable, amount: float, move: Callable[[float], None]) -> bool:
+        """
+        Queue a relative move, merged with pending jogs of the same key
+
+        Parameters
+        ---------
+        Hashable key: commands with equal keys are merged, e.g. ("small", "x")
+        float amount: signed distance or number of steps
+        Callable move: called with the net amount of all merged jogs
+
+        Returns
+        ---------
+        bool: False if the queue is full and the jog was dropped
+        """
+        with self._condition:
+            for entry in reversed(self._queue):
+                if entry[0] == key:
+                    entry[1] += amount
+                    return True
+                if entry[0] is None:
+                    # never merge across another command, e.g. to_zero
+                    break
+            if len(self._queue) >= self.maxsize:
+                return False
+            self._queue.append([key, amount, move, (), {}])
+            self._condition.notify()
+        return True
+
+    def submit(self, function: Callable, *args, **kwargs) -> bool:
+        """
+        Queue a command executed after the commands queued before
+
+        Returns
+        ---------
+        bool: False if the queue is full of other commands and the command was dropped
+        """
+        with self._condition:
+            if len(self._queue) >= self.maxsize and not self._drop_oldest_jog():
+                return False
+            self._queue.append([None, None, function, args, kwargs])
+            self._condition.notify()
+        return True
+
+    def stop(self, function: Callable, *args, **kwargs) -> None:
+        """
+        Discard all queued commands and run function (e.g. the stop of the device) next
+        """
+        with self._condition:
+            self._queue.clear()
+            self._queue.append([None, None, function, args, kwargs])
+            self._condition.notify()
+
+    def get_position(self):
+        """
+        Position for the display: the commanded target while the device may
+        still be moving, the last position read once it has stopped
+        """
+        if not self._settled and self._target_func is not None:
+            target = self._target_func()
+            if target is not None:
+                return target
+        return self.position
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Finish the queued commands and end the thread
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _drop_oldest_jog(self) -> bool:
+        for entry in self._queue:
+            if entry[0] is not None:
+                self._queue.remove(entry)
+                return True
+        return False
+
+    def _refresh_position(self) -> None:
+        try:
+            position = self._position_func()
+        except Exception as error:
+            print(f"{self.name}: reading the position failed ({error!r})")
+            self._settled = True
+            return
+        self._settled = position == self.position
+        self.position = position
+        self._last_activity = time.monotonic()
+
+    def _next_command(self):
+        """
+        Wait for the next queued command, None when the position is due for a refresh
+
+        Returns
+        ---------
+        list: queue entry, None for a refresh, False when the worker was closed
+        """
+        with self._condition:
+            while self._running and not self._queue:
+                if self._settled or self._position_func is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._last_activity + self.refresh_interval - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if not self._queue:
+                return False
+            return self._queue.popleft()
+
+    def _run(self) -> None:
+        while True:
+            entry = self._next_command()
+            if entry is False:
+                return
+            if entry is None:
+                self._refresh_position()
+                continue
+            key, amount, function, args, kwargs = entry
+            try:
+                if key is None:
+                    function(*args, **kwargs)
+                elif amount != 0:
+                    function(amount)
+            except Exception as error:
+                print(f"{self.name}: command failed ({error!r})")
+            self._settled = False
+            self._last_activity = time.monotonic()
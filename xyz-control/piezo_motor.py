@@ -10,8 +10,12 @@
 
 from pylablib.devices import Thorlabs
 import atexit
+import time
 import warnings
 
+# the commanded target is read back from the stage after this many seconds without a move
+RESYNC_INTERVAL_S = 1.0
+
 class PiezoStage:
     """
     Class for controlling the Thorlabs PA13 piezo actuator
@@ -41,30 +45,49 @@ class PiezoStage:
             print("The device was probably opened before or is not even connected!")
             raise ConnectionError
         print("Initialization complete")
+        # commanded target in steps, None if it has to be read from the stage
+        self.target = None
+        self._last_move = 0.0
                     
 
     def _move(self, direction: str = "+", steps: float = 1) -> None:
         self.stage.setup_drive(max_voltage=115, velocity=500, acceleration=1000)
         self.stage.move_by(int(direction + str(steps)))
 
-    def small_move(self, direction: str = "+"):
+    def small_move(self, direction: str = "+", steps: int = 1):
         """
         Move stage for a single step, typically equalling 20 nanometers of travel
+        (or for the given number of single steps at once)
         """
         self.stage.setup_drive(max_voltage=80, velocity=400, acceleration=600)
-        current_pos = self.stage.get_position()
-        self.stage.move_to(current_pos + int(direction + str(1)))
+        self._move_target(int(direction + str(1)) * steps)
         #self.stage.move_by(int(direction + str(10)))
     
-    def big_move(self, direction: str = "+"):
+    def big_move(self, direction: str = "+", steps: int = 1):
         """
-        Move stage for multiple steps (N = 50)
+        Move stage for multiple steps (N = 50), steps times at once
         """
         #self.stage.setup_drive(max_voltage=120, velocity=500, acceleration=1000)
-        current_pos = self.stage.get_position()
-        self.stage.move_to(current_pos + int(direction + str(50)))
+        self._move_target(int(direction + str(50)) * steps)
         #self.stage.move_by(int(direction + str(500)))
 
+    def _move_target(self, steps: int) -> None:
+        """
+        Add steps to the commanded target and move there, the stage position is
+        only read before the first move after a pause
+        """
+        if self.target is None or time.monotonic() - self._last_move > RESYNC_INTERVAL_S:
+            self.sync_target()
+        self.target += steps
+        self.stage.move_to(self.target)
+        self._last_move = time.monotonic()
+
+    def sync_target(self) -> None:
+        """
+        Set the commanded target to the position read from the stage
+        """
+        self.target = self.stage.get_position()
+
     def get_position(self) -> float:
         """
         Get the current position of the piezo motor in number of steps
@@ -73,6 +96,7 @@ class PiezoStage:
     
     def stop(self) -> None:
         self.stage.stop()
+        self.sync_target()
 
     def close(self):
         self.stage.close()
@@ -9,8 +9,12 @@
 """
 
 import libximc.highlevel as ximc
-from typing import Tuple
+from typing import Optional, Tuple
 import atexit
+import time
+
+# the commanded targets are read back from the stage after this many seconds without a move
+RESYNC_INTERVAL_S = 1.0
 
 class Standa_XY:
     """
@@ -46,8 +50,13 @@ class Standa_XY:
         self.axis_2.set_move_settings_calb(settings)
         # applicable for small moves, can be changed during operation!
         self.stepsize_mm = 0.01
+        # (min, max) travel in mm the targets are clamped to, None for no limits
+        self.travel_limits_mm: Optional[Tuple[float, float]] = None
+        # commanded target per axis in mm, None if it has to be read from the stage
+        self.target = {"x": None, "y": None}
+        self._last_move = {"x": 0.0, "y": 0.0}
 
-    def small_move(self, axis: str = "x", direction: str = "+") -> None:
+    def small_move(self, axis: str = "x", direction: str = "+", steps: int = 1) -> None:
         """
         Move the specified axis for the parameter stepsize_mm in a given direction
 
@@ -55,18 +64,14 @@ class Standa_XY:
         ---------
         str axis: select axis for x or y movement
         str direction: direction of travel
+        int steps: number of steps to move at once
 
         Returns
         ---------
         None
         
         """
-        if axis == "x":
-            current_pos = self.axis_1.get_position_calb()
-            self.axis_1.command_move_calb(current_pos.Position + float(direction + str(self.stepsize_mm)))
-        if axis == "y":
-            current_pos = self.axis_2.get_position_calb()
-            self.axis_2.command_move_calb(current_pos.Position + float(direction + str(self.stepsize_mm)))
+        self._move_target(axis, float(direction + str(self.stepsize_mm)) * steps)
 
     def big_move(self, axis: str= "x", distance_mm: float = 1) -> None:
         """
@@ -82,12 +87,33 @@ class Standa_XY:
         None
         
         """
-        if axis == "x":
-            current_pos = self.axis_1.get_position_calb()
-            self.axis_1.command_move_calb(current_pos.Position + distance_mm)
-        if axis == "y":
-            current_pos = self.axis_2.get_position_calb()
-            self.axis_2.command_move_calb(current_pos.Position + distance_mm)
+        self._move_target(axis, distance_mm)
+
+    def _move_target(self, axis: str, distance_mm: float) -> None:
+        """
+        Add distance_mm to the commanded target of the axis, clamped to travel_limits_mm,
+        and move there. The stage position is only read before the first move after a pause.
+        """
+        if axis not in self.target:
+            return
+        if self.target[axis] is None or time.monotonic() - self._last_move[axis] > RESYNC_INTERVAL_S:
+            self.sync_target(axis)
+        target = self.target[axis] + distance_mm
+        if self.travel_limits_mm is not None:
+            target = min(max(target, self.travel_limits_mm[0]), self.travel_limits_mm[1])
+        self.target[axis] = target
+        self._axis(axis).command_move_calb(target)
+        self._last_move[axis] = time.monotonic()
+
+    def _axis(self, axis: str):
+        return self.axis_1 if axis == "x" else self.axis_2
+
+    def sync_target(self, axis: Optional[str] = None) -> None:
+        """
+        Set the commanded target of the axis (both axes for None) to the position read from the stage
+        """
+        for name in ("x", "y") if axis is None else (axis,):
+            self.target[name] = self._axis(name).get_position_calb().Position
 
     def close(self) -> None:
         self.axis_1.close_device()
@@ -98,13 +124,25 @@ class Standa_XY:
         y = self.axis_2.get_position_calb().Position
         return (x, y)
     
+    def get_target(self) -> Optional[Tuple[float, float]]:
+        """
+        Return the commanded (x, y) target in mm without accessing the stage,
+        None if it is not known for both axes
+        """
+        if self.target["x"] is None or self.target["y"] is None:
+            return None
+        return (self.target["x"], self.target["y"])
+
     def get_stepsize_mm(self) -> float:
         return self.stepsize_mm
     
     def stop(self) -> None:
         self.axis_1.command_stop()
         self.axis_2.command_stop()
+        self.sync_target()
 
     def to_zero(self) -> None:
         self.axis_1.command_move_calb(0)
         self.axis_2.command_move_calb(0)
+        self.target = {"x": 0.0, "y": 0.0}
+        self._last_move = {"x": time.monotonic(), "y": time.monotonic()}
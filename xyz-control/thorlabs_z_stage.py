@@ -10,13 +10,20 @@
 
 from pylablib.devices import Thorlabs
 import atexit
+import time
 import warnings
 
+# upper end of the travel range in steps
+MAX_POSITION = 61440000
+# the commanded target is read back from the stage after this many seconds without a move
+RESYNC_INTERVAL_S = 1.0
+
 class Z_Stage:
     """
     Class for controlling Thorlabs Z-stage MLJ250
     When moving continously, command _move_by_ leads to unpredictable behavior
-    --> instead get current position and increment / decrement it respectively
+    --> instead keep the commanded target position and increment / decrement it respectively,
+    reading the stage position only before the first move after a pause and after stop
     1228800 steps = 1 mm
     """
     def __init__(self) -> None:
@@ -47,60 +54,76 @@ class Z_Stage:
         self.stage.home(force=False)
         # stepsize is only applicable for small moves --> initialized with a 0.01 mm stepsize
         self.stepsize = 1228800 / 100
+        # commanded target in steps, None if it has to be read from the stage
+        self.target = None
+        self._last_move = 0.0
 
-    def small_move(self, direction: str = "+") -> None:
+    def small_move(self, direction: str = "+", steps: int = 1) -> None:
         """
         Move stage for an amount of steps
 
         Parameters
         ---------
         str direction: select direction (+ / -) of movement
+        int steps: number of stepsize moves to make at once
 
         Returns
         ---------
         None
         """
-        try:
-            self.stage.setup_velocity(acceleration=50e3, max_velocity=50e6, scale=False)
-            current_pos = self.stage.get_position(scale=False)
-            if current_pos <= 0 and direction == "-":
-                print("You are at the end of the stage, you can only move upwards")
-                return
-            self.stage.move_to(min(current_pos + float(direction + str(self.stepsize)), 61440000))
-        except Thorlabs.ThorlabsError:
-            print("You are probably at the limit of the moving range, aborting ...")
-            return
+        self.stage.setup_velocity(acceleration=50e3, max_velocity=50e6, scale=False)
+        self._move_target(float(direction + str(self.stepsize)) * steps)
         
-    def big_move(self, direction: str = "+") -> None:
+    def big_move(self, direction: str = "+", steps: int = 1) -> None:
         """
         Move stage for an amount of steps
 
         Parameters
         ---------
         str direction: select direction (+ / -) of movement
+        int steps: number of big moves to make at once
 
         Returns
         ---------
         None
         """
+        self.stage.setup_velocity(acceleration=100e3, max_velocity=200e6, scale=False)
+        # self.stage.move_by(float(direction + str(500e3)), scale=False)
+        self._move_target(float(direction + str(1e6)) * steps)
+
+    def _move_target(self, distance: float) -> None:
+        """
+        Add distance (steps) to the commanded target, clamped to the travel range, and move there
+        """
         try:
-            self.stage.setup_velocity(acceleration=100e3, max_velocity=200e6, scale=False)
-            # self.stage.move_by(float(direction + str(500e3)), scale=False)
-            current_pos = self.stage.get_position(scale=False)
-            if current_pos <= 0 and direction == "-":
+            if self.target is None or time.monotonic() - self._last_move > RESYNC_INTERVAL_S:
+                self.sync_target()
+            if self.target <= 0 and distance < 0:
                 print("You are at the end of the stage, you can only move upwards")
                 return
-            self.stage.move_to(min(current_pos + float(direction + str(1e6)), 61440000))
+            self.target = min(max(self.target + distance, 0), MAX_POSITION)
+            self.stage.move_to(self.target)
+            self._last_move = time.monotonic()
         except Thorlabs.ThorlabsError:
             print("You are probably at the limit of the moving range, aborting ...")
+            self.target = None
             return
+
+    def sync_target(self) -> None:
+        """
+        Set the commanded target to the position read from the stage
+        """
+        self.target = self.stage.get_position(scale=False)
         
     def to_zero(self):
         self.stage.setup_velocity(acceleration=100e3, max_velocity=200e6, scale=False)
         self.stage.move_to(0, scale=False)
+        self.target = 0
+        self._last_move = time.monotonic()
 
     def stop(self) -> None:
         self.stage.stop()
+        self.sync_target()
 
     def get_position(self) -> float:
         """
@@ -108,6 +131,13 @@ class Z_Stage:
         """
         return self.stage.get_position(scale=False) / 1228800
 
+    def get_target(self):
+        """
+        Return the commanded target in millimeters without accessing the stage,
+        None if it is not known
+        """
+        return None if self.target is None else self.target / 1228800
+
     def get_stepsize_mm(self) -> float:
         return self.stepsize / 1228800
         
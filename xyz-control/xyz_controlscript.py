@@ -17,18 +17,31 @@ from typing import Tuple
 from standa_xy_stage import Standa_XY
 from thorlabs_z_stage import Z_Stage
 from piezo_motor import PiezoStage
+from command_worker import CommandWorker
+
+
+def step_move(move, steps: int) -> None:
+    """
+    Call a small_move / big_move method for the net number of steps of merged jogs,
+    the sign of steps giving the direction
+    """
+    move(direction="+" if steps > 0 else "-", steps=abs(steps))
 
 
 class ZStageHandler:
     """
     Handling the controls of two stages for the movement in z-direction
     (Thorlabs Labjack & Piezo Motor)
+    The stages are moved by their own command workers, so the calls return immediately
     """
     def __init__(self, labjack, piezo):
         self.big_step = False
         self.piezo_activated = False
         self.labjack = labjack
         self.piezo = piezo
+        self.labjack_worker = CommandWorker("Labjack", position=labjack.get_position,
+                                            target=labjack.get_target)
+        self.piezo_worker = CommandWorker("Piezo")
 
     def move_up(self):
         if self.big_step:
@@ -43,16 +56,18 @@ class ZStageHandler:
             self._small_move(direction="-")
 
     def _small_move(self, direction: str = "+"):
-        if self.piezo_activated:
-            self.piezo.small_move(direction)
-        else:
-            self.labjack.small_move(direction)
+        stage, worker = self._selected_stage()
+        worker.jog("small", int(direction + "1"), partial(step_move, stage.small_move))
     
     def _big_move(self, direction: str = "+"):
+        stage, worker = self._selected_stage()
+        worker.jog("big", int(direction + "1"), partial(step_move, stage.big_move))
+
+    def _selected_stage(self):
         if self.piezo_activated:
-            self.piezo.big_move(direction)
+            return self.piezo, self.piezo_worker
         else:
-            self.labjack.big_move(direction)
+            return self.labjack, self.labjack_worker
 
     def get_stepsize(self):
         if self.piezo_activated:
@@ -70,16 +85,21 @@ class ZStageHandler:
         return self.piezo_activated
     
     def get_position(self):
+        """
+        Commanded target of the Labjack while it moves, else the position read
+        by its worker, None for the piezo
+        """
         if self.piezo_activated:
             return None
         else:
-            return self.labjack.get_position()
+            return self.labjack_worker.get_position()
+
+    def to_zero(self):
+        self.labjack_worker.submit(self.labjack.to_zero)
     
     def stop(self):
-        if self.piezo_activated:
-            self.piezo.stop()
-        else: 
-            self.labjack.stop()
+        stage, worker = self._selected_stage()
+        worker.stop(stage.stop)
 
 
 def initialize_hardware():
@@ -139,32 +159,41 @@ def display_position(
     cv2.imshow("XYZ control", display)
     cv2.waitKey(1)
 
-def key_received(key, standa_stage, z_handler, display):
+def xy_small_move(standa_stage, xy_worker, axis: str, direction: str) -> None:
+    xy_worker.jog(("small", axis), int(direction + "1"),
+                  partial(step_move, partial(standa_stage.small_move, axis)))
+
+def xy_big_move(standa_stage, xy_worker, axis: str, distance_mm: float) -> None:
+    xy_worker.jog(("big", axis), distance_mm, partial(standa_stage.big_move, axis))
+
+def key_received(key, standa_stage, xy_worker, z_handler, display):
+    # runs on the joystick event thread: moves are only queued on the command
+    # workers and the display shows their commanded targets / last read positions
     #print(f"Keytype: {key.keytype}\nKey number: {key.number}\nKey value: {key.value}\n")
     if key.keytype == Key.HAT:
         if key.value == Key.HAT_UP:
-            standa_stage.small_move(axis="y", direction="+")
+            xy_small_move(standa_stage, xy_worker, axis="y", direction="+")
         if key.value == Key.HAT_DOWN:
-            standa_stage.small_move(axis="y", direction="-")
+            xy_small_move(standa_stage, xy_worker, axis="y", direction="-")
         if key.value == Key.HAT_LEFT:
-           standa_stage.small_move(axis="x", direction="-")
+           xy_small_move(standa_stage, xy_worker, axis="x", direction="-")
         if key.value == Key.HAT_RIGHT:
-            standa_stage.small_move(axis="x", direction="+")
+            xy_small_move(standa_stage, xy_worker, axis="x", direction="+")
     if key.keytype == Key.AXIS:
         if key.number == 0:
             if key.value < 0:
                 # left joystick right
-                standa_stage.big_move(axis="x", distance_mm=-1)
+                xy_big_move(standa_stage, xy_worker, axis="x", distance_mm=-1)
             if key.value > 0:
                 # left joystick left
-                standa_stage.big_move(axis="x", distance_mm=1)
+                xy_big_move(standa_stage, xy_worker, axis="x", distance_mm=1)
         if key.number == 1:
             if key.value < 0:
                 # left joystick up
-                standa_stage.big_move(axis="y", distance_mm=1)
+                xy_big_move(standa_stage, xy_worker, axis="y", distance_mm=1)
             if key.value > 0:
                 # left joystick down
-                standa_stage.big_move(axis="y", distance_mm=-1)
+                xy_big_move(standa_stage, xy_worker, axis="y", distance_mm=-1)
         if key.number == 3:
             if key.value < 0:
                 # right joystick left
@@ -209,8 +238,8 @@ def key_received(key, standa_stage, z_handler, display):
         if key.number == 10:
             # HOME Button
             if key.value:
-                standa_stage.to_zero()
-                z_handler.labjack.to_zero()
+                xy_worker.submit(standa_stage.to_zero)
+                z_handler.to_zero()
         if key.number == 4:
             # L1
             if key.value:
@@ -234,7 +263,7 @@ def key_received(key, standa_stage, z_handler, display):
             if key.value:
                 z_handler.move_down()
     # display position and step size data in a cv2 window
-    xy_pos = standa_stage.get_position()
+    xy_pos = xy_worker.get_position()
     z_pos = z_handler.get_position()
     stepsize_z = z_handler.labjack.get_stepsize_mm()
     stepsize_xy = standa_stage.get_stepsize_mm()
@@ -246,9 +275,12 @@ def key_received(key, standa_stage, z_handler, display):
 if __name__ == "__main__":
     z_stage, xy_stage, piezo_stage = initialize_hardware()
     z_handler = ZStageHandler(labjack=z_stage, piezo=piezo_stage)
+    xy_worker = CommandWorker("Standa XY", position=xy_stage.get_position,
+                              target=xy_stage.get_target)
     display = initialize_display()
     arg_handler = partial(key_received, 
                           standa_stage=xy_stage, 
+                          xy_worker=xy_worker,
                           z_handler=z_handler,
                           display=display)
     repeater = pyjoystick.Repeater(first_repeat_timeout=1, 